@@ -11,9 +11,12 @@ class SgeOptions(object):
 
     """Define options to configure SGE."""
 
+    # default for SgeOptions pickled before jobs_per_qsub was added
+    jobs_per_qsub = 1
+
     def __init__(self, unique_id, use_sge=False, max_sge_jobs=40,
                  blasr_nproc=24, gcon_nproc=8, quiver_nproc=8,
-                 sge_queue=None, sge_env_name="smp"):
+                 sge_queue=None, sge_env_name="smp", jobs_per_qsub=1):
         self.unique_id = unique_id
         self.use_sge = use_sge
         self.max_sge_jobs = max_sge_jobs
@@ -22,6 +25,7 @@ class SgeOptions(object):
         self.quiver_nproc = quiver_nproc
         self.sge_queue = sge_queue
         self.sge_env_name = sge_env_name
+        self.jobs_per_qsub = jobs_per_qsub
 
     def __str__(self):
         return "unqiueID={i}\n".format(i=self.unique_id) + \
@@ -31,7 +35,8 @@ class SgeOptions(object):
                "sge_env_name={s}\n".format(s=self.sge_env_name) + \
                "blasr_nproc={n}\n".format(n=self.blasr_nproc) + \
                "gcon_nproc={n}\n".format(n=self.gcon_nproc) + \
-               "quiver_nproc={t}\n".format(t=self.quiver_nproc)
+               "quiver_nproc={t}\n".format(t=self.quiver_nproc) + \
+               "jobs_per_qsub={n}\n".format(n=self.jobs_per_qsub)
 
     def qsub_cmd(self, script, num_threads,
                  wait_before_exit=False, depend_on_jobs=None,
@@ -48,6 +53,22 @@ class SgeOptions(object):
           olog - output log
           is_script - if Yes, input is a script, else input is an executable.
         """
+        return self.qsub_cmd_template(num_threads=num_threads,
+                                      wait_before_exit=wait_before_exit,
+                                      depend_on_jobs=depend_on_jobs,
+                                      is_script=is_script).format(
+                                          script=script, elog=elog, olog=olog)
+
+    def qsub_cmd_template(self, num_threads,
+                          wait_before_exit=False, depend_on_jobs=None,
+                          is_script=True):
+        """
+        Return a qsub cmd template, which can be formatted with
+        {script}, {elog} and {olog} to get a cmd string to run
+        script on sge, e.g., template.format(script=..., elog=..., olog=...).
+        Build it once and reuse it when submitting many scripts
+        with the same options. See qsub_cmd for parameters.
+        """
         # always execute the job from the current directory
         # -V specify all env vars
         # -S specify shell for the job
@@ -64,23 +85,27 @@ class SgeOptions(object):
         if depend_on_jobs is not None:
             ret += "-hold_jid {jids} ".format(jids=",".join(depend_on_jobs))
 
-        ret += "-e {e} -o {o} ".format(e=elog, o=olog)
+        # escape braces in options, only leave {elog}, {olog} and {script}.
+        ret = ret.replace("{", "{{").replace("}", "}}")
+        ret += "-e {elog} -o {olog} "
 
         if not is_script:
             ret += "-b y "
 
-        ret += "{script}".format(script=script)
+        ret += "{script}"
         return ret
 
     def cmd_str(self, show_blasr_nproc=False, show_gcon_nproc=False,
                 show_quiver_nproc=False, show_sge_queue=False,
-                show_sge_env_name=False):
+                show_sge_env_name=False, show_jobs_per_qsub=False):
         """Return a cmd string."""
         cmd = ""
         if self.use_sge is True:
             cmd += "--use_sge "
             cmd += "--max_sge_jobs={n} ".format(n=self.max_sge_jobs)
             cmd += "--unique_id={n} ".format(n=self.unique_id)
+            if show_jobs_per_qsub is True and self.jobs_per_qsub is not None:
+                cmd += "--jobs_per_qsub={n} ".format(n=self.jobs_per_qsub)
         if show_blasr_nproc is True and self.blasr_nproc is not None:
             cmd += "--blasr_nproc={n} ".format(n=self.blasr_nproc)
         if show_gcon_nproc is True and self.gcon_nproc is not None:
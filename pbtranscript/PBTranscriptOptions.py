@@ -307,7 +307,8 @@ def add_ice_arguments(arg_parser, tc_parser=None):
     return arg_parser
 
 
-def add_sge_arguments(arg_parser, blasr_nproc=False, quiver_nproc=False, gcon_nproc=False):
+def add_sge_arguments(arg_parser, blasr_nproc=False, quiver_nproc=False, gcon_nproc=False,
+                      jobs_per_qsub=False):
     """Add Sge arguments as a group to parser, return parser."""
     sge_group = arg_parser.add_argument_group("SGE environment arguments")
 
@@ -350,6 +351,13 @@ def add_sge_arguments(arg_parser, blasr_nproc=False, quiver_nproc=False, gcon_np
                                type=int,
                                default=4,
                                help="Number of CPUs for each PBDagcon job. (default: 4)")
+    if jobs_per_qsub is True:
+        sge_group.add_argument("--jobs_per_qsub",
+                               dest="jobs_per_qsub",
+                               type=int,
+                               default=1,
+                               help="Number of quiver jobs to run one after " +
+                                    "another in each submitted SGE job. (default: 1)")
 
     sge_group.add_argument("--sge_env_name",
                            type=str,
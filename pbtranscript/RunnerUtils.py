@@ -6,13 +6,26 @@ Job runner utils for both SGE jobs and local jobs.
 import subprocess
 import logging
 import time
-import os
+import threading
+from collections import defaultdict
+import xml.etree.cElementTree as ET
 from multiprocessing.pool import ThreadPool
 from pbcore.util.Process import backticks
 from pbtranscript.ClusterOptions import SgeOptions
 
 __author__ = 'etseng|yli@pacificbiosciences.com'
 
+# qstat output is cached for _QSTAT_TTL seconds, so that concurrent
+# waiters in the same process share one qstat call.
+_QSTAT_TTL = 1.5
+_QSTAT_CACHE = {'ts': 0.0, 'data': {}}
+_QSTAT_LOCK = threading.Lock()
+
+# At most this many qsub calls run concurrently in this process,
+# submitting too many jobs at once may overload the sge qmaster.
+_MAX_CONCURRENT_QSUB = 8
+_QSUB_SEMAPHORE = threading.Semaphore(_MAX_CONCURRENT_QSUB)
+
 class SgeTimeOutException(Exception):
     """
     SGE Time out exception which can be raised
@@ -29,14 +42,14 @@ def write_cmd_to_script(cmd, script):
       cmd - a cmd string or a list of cmds
       script - a script file to save cmd/cmds
     """
+    if isinstance(cmd, str):
+        body = cmd
+    elif isinstance(cmd, (list, tuple)):
+        body = "\n".join(cmd)
+    else:
+        raise TypeError("cmd %r must be either a str or a list of str." % (cmd, ))
     with open(script, 'w') as writer:
-        writer.write("#!/bin/bash\n")
-        if isinstance(cmd, str):
-            writer.write(cmd + '\n')
-        elif isinstance(cmd, list):
-            writer.write("\n".join(cmd))
-        else:
-            assert False
+        writer.write("#!/bin/bash\n" + body + "\n")
 
 
 def local_job_runner(cmds_list, num_threads, throw_error=True):
@@ -54,14 +67,16 @@ def local_job_runner(cmds_list, num_threads, throw_error=True):
       rescue - whether or not to rescue this job
       rescue_times - maximum number of rescue times
     """
-    run_cmd_in_shell = lambda x: backticks(x, merge_stderr=True)
-    try:
-        pool = ThreadPool(processes=num_threads)
-        rets = pool.map(run_cmd_in_shell, cmds_list)
-        pool.close()
-        pool.join()
-    except subprocess.CalledProcessError:
-        pass
+    rets = []
+    if len(cmds_list) > 0:
+        run_cmd_in_shell = lambda x: backticks(x, merge_stderr=True)
+        # No need to start more threads than there are cmds.
+        pool = ThreadPool(processes=max(1, min(num_threads, len(cmds_list))))
+        try:
+            rets = pool.map(run_cmd_in_shell, cmds_list)
+        finally:
+            pool.close()
+            pool.join()
 
     failed_cmds = [cmds_list[i] for i in range(0, len(cmds_list)) if rets[i][1] != 0]
     failed_cmds_out = [rets[i][0] for i in range(0, len(cmds_list)) if rets[i][1] != 0]
@@ -74,17 +89,57 @@ def local_job_runner(cmds_list, num_threads, throw_error=True):
         return failed_cmds
 
 
-def get_active_sge_jobs():
+def _parse_qstat_xml():
+    """Call 'qstat -xml' once and return {jid: status} of active jobs."""
+    p = subprocess.Popen(["qstat", "-xml"], stdout=subprocess.PIPE)
+    out = {}
+    try:
+        for dummy_event, elem in ET.iterparse(p.stdout):
+            if elem.tag == 'job_list':
+                out[elem.findtext('JB_job_number')] = elem.findtext('state')
+                elem.clear()
+    finally:
+        p.stdout.close()
+        code = p.wait()
+    if code != 0:
+        raise subprocess.CalledProcessError(code, "qstat -xml")
+    return out
+
+
+def get_active_sge_jobs(qstat_try_times=3):
     """Return a dict of active sge job ids and their status by
     calling qstat.
 
     output - {jid: status}, e.g., {'199':'r', '200':'hqw'}
+    Results are cached for _QSTAT_TTL seconds. qstat may fail
+    transiently, keep trying for at most {qstat_try_times} times,
+    sleeping 1, 2, 4, ... seconds in between.
     """
-    try:
-        stuff = os.popen("qstat").read().strip().split('\n')
-        return dict({x.split()[0]: x.split()[4] for x in stuff[2:]})
-    except Exception as e:
-        raise RuntimeError("Unable to get active qsub jobs.", str(e))
+    with _QSTAT_LOCK:
+        now = time.time()
+        if 0 <= now - _QSTAT_CACHE['ts'] < _QSTAT_TTL:
+            return dict(_QSTAT_CACHE['data'])
+        try_times = 1
+        while True:
+            try:
+                data = _parse_qstat_xml()
+                break
+            except Exception as e:
+                if try_times >= qstat_try_times:
+                    raise RuntimeError("Unable to get active qsub jobs.", str(e))
+                time.sleep(2 ** (try_times - 1))
+                try_times += 1
+        now = time.time()
+        _QSTAT_CACHE['ts'] = now
+        _QSTAT_CACHE['data'] = data
+        return dict(data)
+
+
+def _invalidate_qstat_cache():
+    """Drop cached qstat output, which cannot contain jobs submitted since."""
+    with _QSTAT_LOCK:
+        _QSTAT_CACHE['ts'] = 0.0
+        _QSTAT_CACHE['data'] = {}
 
 
 def sge_submit(qsub_cmd, qsub_try_times=1):
@@ -102,6 +157,8 @@ def sge_submit(qsub_cmd, qsub_try_times=1):
     while try_times <= qsub_try_times:
         out, code, dummy_msg = backticks(qsub_cmd)
         if code == 0: # succeeded, break
+            # a cached qstat snapshot would report the new job as done
+            _invalidate_qstat_cache()
             # Your job 596028 ("a.sh") has been submitted
             return str(out).split()[2]
         else:
@@ -141,11 +198,12 @@ def sge_submit(qsub_cmd, qsub_try_times=1):
 
 
 def kill_sge_jobs(jids):
-    """Kill given sge jobs."""
-    for jid in jids:
-        kill_cmd = "qdel {jid}".format(jid=jid)
-        backticks(kill_cmd) # don't care whether it worked.
-        time.sleep(3) # wiat for qdel to take effect...
+    """Kill given sge jobs using a single qdel call."""
+    if len(jids) == 0:
+        return
+    kill_cmd = "qdel {jids}".format(jids=" ".join([str(jid) for jid in jids]))
+    backticks(kill_cmd) # don't care whether it worked.
+    time.sleep(3) # wait for qdel to take effect...
 
 
 def wait_for_sge_jobs(jids, wait_timeout=None, run_timeout=None):
@@ -177,19 +235,34 @@ def wait_for_sge_jobs(jids, wait_timeout=None, run_timeout=None):
                    not counting qw or hold time. qdel it otherwise.
                    If is None, no cap.
     """
+    if len(jids) == 0:
+        return []
+
     count = 0
-    check_sge_every_n_seconds = 10 # check sge every n seconds.
+    # Check sge with exponential backoff, starting from MIN_DELAY seconds
+    # and capped at MAX_DELAY seconds. Reset delay whenever the set of
+    # active jobs changes, so that transitions are detected quickly.
+    MIN_DELAY, MAX_DELAY = 2, 60
+    delay = MIN_DELAY
+    prev_not_done_jids = None
     time_passed = 0
-    runtime_passed = dict({jid: 0 for jid in jids})
+    runtime_passed = defaultdict(int) # running jobs only, jid -> seconds running
     killed_jobs = [] # jobs that have been killed.
 
     while True:
         active_d = get_active_sge_jobs()
-        not_done_jids = list(set(jids).intersection(set(active_d.keys())))
+        not_done_jids = [jid for jid in jids if jid in active_d]
         if len(not_done_jids) != 0:
             # some sge jobs are still running or qw, or held
-            time.sleep(check_sge_every_n_seconds)
-            time_passed += check_sge_every_n_seconds
+            if prev_not_done_jids is not None:
+                if set(not_done_jids) == prev_not_done_jids:
+                    delay = min(delay * 2, MAX_DELAY)
+                else:
+                    delay = MIN_DELAY
+            prev_not_done_jids = set(not_done_jids)
+
+            time.sleep(delay)
+            time_passed += delay
             count += 1
             if count % 100 == 0:
                 logging.debug("Waiting for sge job to complete: %s.",
@@ -204,12 +277,14 @@ def wait_for_sge_jobs(jids, wait_timeout=None, run_timeout=None):
                 # update runtime_passed
                 for jid in not_done_jids:
                     if active_d[jid].startswith('r'):
-                        runtime_passed[jid] += check_sge_every_n_seconds
+                        runtime_passed[jid] += delay
 
-                to_kill_jids = [jid for jid in not_done_jids
-                                if runtime_passed[jid] >= run_timeout]
+                to_kill_jids = [jid for jid, t in runtime_passed.iteritems()
+                                if t >= run_timeout]
                 kill_sge_jobs(jids=to_kill_jids)
                 killed_jobs.extend(to_kill_jids)
+                for jid in to_kill_jids: # do not kill them again
+                    del runtime_passed[jid]
         else:
             break
 
@@ -254,17 +329,38 @@ def sge_job_runner(cmds_list, script_files,
     if len(cmds_list) != len(script_files):
         raise ValueError("Number of commands and script files "
                          "passed to sge_job_runner must be the same.")
-    jids = []
-    jids_to_cmds = {}
-    jids_to_scripts = {}
+    if rescue not in (None, "locally", "sge"):
+        raise ValueError("Unable to recognize rescue type {r}.".format(r=rescue))
+    jobs = [] # a list of (cmd, script, qsub_cmd) tuples
+    qsub_cmd_template = sge_opts.qsub_cmd_template(num_threads=num_threads_per_job)
     for cmd, script in zip(cmds_list, script_files):
         if run_timeout is not None and not cmd.startswith("timeout"):
             cmd = "timeout %d %s" % (run_timeout, cmd)
         write_cmd_to_script(cmd=cmd, script=script)
-        qsub_cmd = sge_opts.qsub_cmd(script=script, num_threads=num_threads_per_job,
-                                     elog=script+".elog", olog=script+".olog")
-        jid = sge_submit(qsub_cmd=qsub_cmd, qsub_try_times=qsub_try_times)
-        jids.append(jid)
+        qsub_cmd = qsub_cmd_template.format(script=script, elog=script+".elog",
+                                            olog=script+".olog")
+        jobs.append((cmd, script, qsub_cmd))
+
+    def _submit(job):
+        """Submit a job, wait if too many qsub calls are running."""
+        with _QSUB_SEMAPHORE:
+            return sge_submit(qsub_cmd=job[2], qsub_try_times=qsub_try_times)
+
+    # qsub jobs are independent, submit them in parallel. The semaphore
+    # also caps qsub calls of concurrent sge_job_runner calls, no need
+    # for more threads than it admits.
+    jids = []
+    if len(jobs) > 0:
+        pool = ThreadPool(processes=min(_MAX_CONCURRENT_QSUB, len(jobs)))
+        try:
+            jids = pool.map(_submit, jobs)
+        finally:
+            pool.close()
+            pool.join()
+
+    jids_to_cmds = {}
+    jids_to_scripts = {}
+    for jid, (cmd, script, dummy_qsub_cmd) in zip(jids, jobs):
         jids_to_cmds[jid] = cmd
         jids_to_scripts[jid] = script
 
@@ -283,7 +379,9 @@ def sge_job_runner(cmds_list, script_files,
     killed_cmds = [jids_to_cmds[jid] for jid in killed_jobs]
     killed_scripts = [jids_to_scripts[jid] for jid in killed_jobs]
 
-    if rescue is None or rescue_times <= 0:
+    if len(killed_cmds) == 0: # nothing to rescue
+        return []
+    elif rescue is None or rescue_times <= 0:
         return zip(killed_cmds, killed_scripts)
     elif rescue == "locally": # retry at most once if running locally
         ret = []
@@ -295,7 +393,7 @@ def sge_job_runner(cmds_list, script_files,
                 ret.append((killed_cmd, killed_script))
         return ret
     elif rescue == "sge":
-        return sge_job_runner(cmds_list=[], script_files=[],
+        return sge_job_runner(cmds_list=killed_cmds, script_files=killed_scripts,
                               num_threads_per_job=num_threads_per_job,
                               sge_opts=sge_opts, qsub_try_times=qsub_try_times,
                               wait_timeout=wait_timeout, run_timeout=run_timeout,
@@ -0,0 +1,37 @@
+"""Cython inner loops of pbtranscript.counting.CountingUtils."""
+
+__ALL__ = ["emit_mapped_members", "add_mapped_members"]
+
+
+def emit_mapped_members(set mapped_holder, members, restricted_movies,
+                        writer, pbid, bint is_fl, stat):
+    """
+    For each read in members whose movie is in restricted_movies
+    (or all reads if restricted_movies is None), add it to mapped_holder
+    and write its read status (is_fl, stat, pbid) using writer.writeFields.
+    """
+    write_fields = writer.writeFields
+    if restricted_movies is None:
+        for read_id in members:
+            mapped_holder.add(read_id)
+            write_fields(read_id, is_fl, stat, pbid)
+    else:
+        for read_id in members:
+            if read_id.partition('/')[0] in restricted_movies:
+                mapped_holder.add(read_id)
+                write_fields(read_id, is_fl, stat, pbid)
+
+
+def add_mapped_members(mapped, members, restricted_movies, pbid):
+    """
+    For each read in members whose movie is in restricted_movies
+    (or all reads if restricted_movies is None), add pbid to
+    mapped[read], where mapped is a defaultdict(set).
+    """
+    if restricted_movies is None:
+        for read_id in members:
+            mapped[read_id].add(pbid)
+    else:
+        for read_id in members:
+            if read_id.partition('/')[0] in restricted_movies:
+                mapped[read_id].add(pbid)
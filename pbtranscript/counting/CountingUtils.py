@@ -7,9 +7,19 @@ read mapping abundance file.
 import os.path as op
 from collections import defaultdict
 from cPickle import load
+import numpy as np
 #from csv import DictReader
-from pbtranscript.io import GroupReader, MapStatus, ReadStatRecord, \
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+from pbtranscript.io import GroupReader, MapStatus, \
         ReadStatReader, ReadStatWriter, AbundanceRecord, AbundanceWriter
+from pbtranscript.counting.c_count import emit_mapped_members, add_mapped_members
 
 
 __author__ = 'etseng@pacificbiosciences.com'
@@ -19,7 +29,85 @@ __all__ = ["read_group_file",
            "output_read_count_FL",
            #"output_read_count_RoI",
            "output_read_count_nFL",
-           "make_abundance_file"]
+           "make_abundance_file",
+           "convert_pickle_to_msgpack"]
+
+# Fields of uc pickles (e.g., final.pickle, nfl.all.partial_uc.pickle)
+# needed to count reads.
+_PICKLE_CLUSTER_FIELDS = ('uc', 'partial_uc')
+_PICKLE_NOHIT_FIELD = 'nohit'
+
+
+def _restrict_to_movies(read_ids, restricted_movies):
+    """Return read_ids whose movie names are in restricted_movies,
+    or read_ids itself if restricted_movies is None."""
+    if restricted_movies is None:
+        return read_ids
+    return [read_id for read_id in read_ids
+            if read_id.partition('/')[0] in restricted_movies]
+
+
+def _pbids_by_cluster_number(info):
+    """Given {cid: pbid} of a sample (e.g., {'c123': 'PB.1.1'}), return
+    {123: 'PB.1.1'} keyed by the integer cluster ids used in ICE pickles."""
+    return dict((int(cid[1:]), pbid) for cid, pbid in info.iteritems()
+                if cid.startswith('c') and cid[1:].isdigit())
+
+
+def convert_pickle_to_msgpack(pickle_filename, msgpack_filename=None):
+    """
+    Convert uc, partial_uc and nohit in a uc pickle (e.g., final.pickle or
+    nfl.all.partial_uc.pickle) to a msgpack stream, which output_read_count_FL
+    and output_read_count_nFL read one cluster at a time instead of
+    unpickling the whole pickle.
+    Each msgpack object is a [field, cid, read_ids] list, where field is
+    either uc or partial_uc, or ['nohit', None, read_ids].
+    Parameters:
+      pickle_filename - input uc pickle
+      msgpack_filename - output msgpack file, default is pickle_filename + '.msgpack'
+    Return msgpack_filename.
+    """
+    if msgpack is None:
+        raise ImportError("msgpack is required to convert %s." % pickle_filename)
+    if msgpack_filename is None:
+        msgpack_filename = pickle_filename + '.msgpack'
+    with open(pickle_filename, 'rb') as h:
+        d = load(h)
+    packer = msgpack.Packer()
+    with open(msgpack_filename, 'wb') as writer:
+        for field in _PICKLE_CLUSTER_FIELDS:
+            for cid, members in d.get(field, {}).iteritems():
+                writer.write(packer.pack([field, cid, list(members)]))
+        if _PICKLE_NOHIT_FIELD in d:
+            writer.write(packer.pack([_PICKLE_NOHIT_FIELD, None, list(d[_PICKLE_NOHIT_FIELD])]))
+    return msgpack_filename
+
+
+def _iter_pickle_records(pickle_filename):
+    """
+    Yield (field, cid, read_ids) of clusters in a uc pickle, where field
+    is either uc or partial_uc; and ('nohit', None, read_ids) if the pickle
+    has nohit reads.
+    If pickle_filename + '.msgpack' created by convert_pickle_to_msgpack
+    exists, is not older than the pickle and msgpack is available, stream
+    clusters from it, otherwise load the whole pickle.
+    """
+    if not op.exists(pickle_filename):
+        raise IOError("%s does not exist." % pickle_filename)
+    msgpack_filename = pickle_filename + '.msgpack'
+    if msgpack is not None and op.exists(msgpack_filename) and \
+       op.getmtime(msgpack_filename) >= op.getmtime(pickle_filename):
+        with open(msgpack_filename, 'rb') as h:
+            for field, cid, read_ids in msgpack.Unpacker(h, raw=True):
+                yield field, cid, read_ids
+    else:
+        with open(pickle_filename, 'rb') as h:
+            d = load(h)
+        for field in _PICKLE_CLUSTER_FIELDS:
+            for cid, members in d.get(field, {}).iteritems():
+                yield field, cid, members
+        if _PICKLE_NOHIT_FIELD in d:
+            yield _PICKLE_NOHIT_FIELD, None, d[_PICKLE_NOHIT_FIELD]
 
 
 def read_group_file(group_filename, is_cid=True, sample_prefixes=None):
@@ -36,21 +124,23 @@ def read_group_file(group_filename, is_cid=True, sample_prefixes=None):
     else:
         cid_info[None] = {}
 
+    prefix_set = set(sample_prefixes) if sample_prefixes is not None else None
+
     reader = GroupReader(group_filename)
     for group in reader:
         pbid, members = group.name, group.members
         for cid in members:
             # ex: x is 'i1_c123/f3p0/123 or
             # m131116_014707_42141_c100591062550000001823103405221462_s1_p0/93278/31_1189_CCS
-            if sample_prefixes is None:
+            if prefix_set is None:
                 if is_cid:
-                    cid = cid.split('/')[0]
+                    cid = cid.partition('/')[0]
                 cid_info[None][cid] = pbid
             else:
-                if any(cid.startswith(sample_prefix + '|') for sample_prefix in sample_prefixes):
-                    sample_prefix, cid = cid.split('|', 1)
+                sample_prefix, sep, cid = cid.partition('|')
+                if sep and sample_prefix in prefix_set:
                     if is_cid:
-                        cid = cid.split('/')[0]
+                        cid = cid.partition('/')[0]
                     cid_info[sample_prefix][cid] = pbid
     reader.close()
     return cid_info
@@ -66,7 +156,7 @@ def read_group_file(group_filename, is_cid=True, sample_prefixes=None):
 #
 #    id\tlength\tis_fl\tstat\tpbid
 #    """
-#    mapped = {}  # nFL seq -> list of (sample_prefix, cluster) it belongs to
+#    mapped = defaultdict(set)  # nFL seq -> set of pbids it belongs to
 #
 #    writer = ReadStatWriter(output_filename, output_mode)
 #
@@ -88,8 +178,6 @@ def read_group_file(group_filename, is_cid=True, sample_prefixes=None):
 #                # is only potentially unmapped, add all (movie-restricted) members
 #                # to unmapped holder
 #                pbid = cid_info[cid]
-#                if x not in mapped:
-#                    mapped[x] = set()
 #                mapped[x].add(pbid)
 #        else:
 #            # unmapped
@@ -153,39 +241,32 @@ def output_read_count_FL(cid_info, prefix_pickle_filename_tuples, output_filenam
     # the pickles then to get the true unmapped just to {unmapped} - {mapped}
     is_fl = True
 
+    if restricted_movies is not None:
+        restricted_movies = frozenset(restricted_movies)
+
     writer = ReadStatWriter(output_filename, mode=output_mode)
 
     for sample_prefix, pickle_filename in prefix_pickle_filename_tuples:
-        if not op.exists(pickle_filename):
-            raise IOError("%s does not exist." % pickle_filename)
-        with open(pickle_filename) as h:
-            uc = load(h)['uc']
-        for cid_no_prefix, members in uc.iteritems():
-            cid = 'c' + str(cid_no_prefix)
-            if cid in cid_info[sample_prefix]:
+        mapped_cids = _pbids_by_cluster_number(cid_info[sample_prefix])
+        for field, cid_no_prefix, members in _iter_pickle_records(pickle_filename):
+            if field != 'uc':
+                continue
+            pbid = mapped_cids.get(cid_no_prefix)
+            if pbid is not None:
                 # can immediately add all (movie-restricted) members to mapped
-                for read_id in members:
-                    movie = read_id.split('/')[0]
-                    if restricted_movies is None or movie in restricted_movies:
-                        mapped_holder.add(read_id)
-                        record = ReadStatRecord(name=read_id, is_fl=is_fl,
-                                                stat=MapStatus.UNIQUELY_MAPPED,
-                                                pbid=cid_info[sample_prefix][cid])
-                        writer.writeRecord(record)
+                emit_mapped_members(mapped_holder, members, restricted_movies,
+                                    writer, pbid, is_fl, MapStatus.UNIQUELY_MAPPED)
             else:
                 # is only potentially unmapped, add all (movie-restricted) members to
                 # unmapped holder
-                for read_id in members:
-                    movie = read_id.split('/')[0]
-                    if restricted_movies is None or movie in restricted_movies:
-                        unmapped_holder.add(read_id)
+                unmapped_holder.update(_restrict_to_movies(members, restricted_movies))
 
     # now with all the pickles processed we can determine which of all (movie-restricted) FL reads
     # are not mapped in any of the pickles
-    unmapped_holder = unmapped_holder.difference(mapped_holder)
     for read_id in unmapped_holder:
-        record = ReadStatRecord(name=read_id, is_fl=is_fl, stat=MapStatus.UNMAPPED, pbid=None)
-        writer.writeRecord(record)
+        if read_id in mapped_holder:
+            continue
+        writer.writeFields(name=read_id, is_fl=is_fl, stat=MapStatus.UNMAPPED, pbid=None)
 
     writer.close()
 
@@ -209,40 +290,27 @@ def output_read_count_nFL(cid_info, prefix_pickle_filename_tuples, output_filena
     """
     unmapped_holder = set() # will hold anything that was unmapped in one of the pickles
     # then to get the true unmapped just to {unmapped} - {mapped}
-    mapped = {} # nFL seq -> list of (sample_prefix, cluster) it belongs to
+    mapped = defaultdict(set) # nFL seq -> set of pbids it belongs to
     is_fl = False # nFL read
 
+    if restricted_movies is not None:
+        restricted_movies = frozenset(restricted_movies)
+
     writer = ReadStatWriter(output_filename, mode=output_mode)
 
     for sample_prefix, pickle_filename in prefix_pickle_filename_tuples:
-        if not op.exists(pickle_filename):
-            raise IOError("%s does not exist." % pickle_filename)
-        with open(pickle_filename) as h:
-            result = load(h)
-            uc = result['partial_uc']
-            if restricted_movies is None:
-                unmapped_holder.update(result['nohit'])
-            else:
-                #unmapped_holder.update(filter(lambda x: x.split('/')[0] in restricted_movies,
-                #                              result['nohit']))
-                unmapped_holder.update([x for x in result['nohit']
-                                        if x.split('/')[0] in restricted_movies])
-
-        for cid_no_prefix, members in uc.iteritems():
-            cid = 'c' + str(cid_no_prefix)
-            if cid in cid_info[sample_prefix]: # is at least mapped
-                pbid = cid_info[sample_prefix][cid]
-                for read_id in members:
-                    movie = read_id.split('/')[0]
-                    if restricted_movies is None or movie in restricted_movies:
-                        if read_id not in mapped:
-                            mapped[read_id] = set()
-                        mapped[read_id].add(pbid)
+        mapped_cids = _pbids_by_cluster_number(cid_info[sample_prefix])
+        for field, cid_no_prefix, members in _iter_pickle_records(pickle_filename):
+            if field == _PICKLE_NOHIT_FIELD:
+                unmapped_holder.update(_restrict_to_movies(members, restricted_movies))
+                continue
+            elif field != 'partial_uc':
+                continue
+            pbid = mapped_cids.get(cid_no_prefix)
+            if pbid is not None: # is at least mapped
+                add_mapped_members(mapped, members, restricted_movies, pbid)
             else: # not entirely sure it is unmapped but put it in the meantime
-                for read_id in members:
-                    movie = read_id.split('/')[0]
-                    if restricted_movies is None or movie in restricted_movies:
-                        unmapped_holder.add(read_id)
+                unmapped_holder.update(_restrict_to_movies(members, restricted_movies))
 
     # now we can go through the list of mapped to see which are uniquely mapped which are not
     for seqid, pbids in mapped.iteritems():
@@ -251,46 +319,65 @@ def output_read_count_nFL(cid_info, prefix_pickle_filename_tuples, output_filena
         else:
             stat = MapStatus.AMBIGUOUSLY_MAPPED
         for pbid in pbids:
-            record = ReadStatRecord(name=seqid, is_fl=is_fl, stat=stat, pbid=pbid)
-            writer.writeRecord(record)
+            writer.writeFields(name=seqid, is_fl=is_fl, stat=stat, pbid=pbid)
 
-    unmapped_holder = unmapped_holder.difference(mapped)
     # write the nohits
     for read_id in unmapped_holder:
-        record = ReadStatRecord(name=read_id, is_fl=is_fl, stat=MapStatus.UNMAPPED, pbid=None)
-        writer.writeRecord(record)
+        if read_id in mapped:
+            continue
+        writer.writeFields(name=read_id, is_fl=is_fl, stat=MapStatus.UNMAPPED, pbid=None)
 
     writer.close()
 
 
-def make_abundance_file(read_stat_filename, output_filename, given_total=None,
-                        restricted_movies=None, write_header_comments=True):
+def _tally_read_stats(read_stat_filename, restricted_movies=None):
     """
-    Make read mapping abundance file.
-    If given_total is not None, use it instead of the total count based on <read_stat_filename>
-    given_total should be dict of {fl, nfl, nfl_amb}
-    Parameters:
-      read_stat_filename - path to a read status file each line of which is a ReadStatRecord
-      output_filename - path to output abundance file.
+    Tally FL, unique nFL and ambiguous nFL reads mapped to each pbid
+    in a read status file, using ReadStatReader.
+    Return (pbid_to_idx, fl, nfl, nfl_amb, total_fl, total_nfl, total_nfl_amb), where
+      pbid_to_idx - {pbid: i}, index of pbid in the arrays below
+      fl, nfl - numpy int64 arrays, number of FL, unique nFL reads mapped to each pbid
+      nfl_amb - numpy float64 array, weighted number of ambiguous nFL reads
+      total_* - number of distinct FL, nFL, ambiguous nFL reads
     """
     total_ids = {'fl':set(), 'nfl':set(), 'nfl_amb':set()}
 
-    # pbid, could be NA or None --> # of FL reads mapped to it
-    tally = defaultdict(lambda: {'fl':0, 'nfl':0, 'nfl_amb':0})
-    amb_count = defaultdict(lambda: []) # non-fl id --> list of pbid matches
+    # pbid --> index in fl, nfl, nfl_amb
+    pbid_to_idx = {}
+    fl, nfl, nfl_amb = [], [], []
+    amb_count = defaultdict(list) # non-fl id --> list of pbid matches
+
+    def _idx(pbid):
+        """Return index of pbid, allocate a new slot if pbid is unseen."""
+        i = pbid_to_idx.setdefault(pbid, len(fl))
+        if i == len(fl):
+            fl.append(0)
+            nfl.append(0)
+            nfl_amb.append(0.)
+        return i
+
+    # movie name --> interned movie name, so that each distinct movie name
+    # is kept once and compared with interned restricted_movies by identity.
+    movie_cache = {}
+    def _movie_of(name):
+        """Return interned movie name of a read name."""
+        movie = name.partition('/')[0]
+        cached = movie_cache.get(movie)
+        if cached is None:
+            cached = movie_cache[movie] = intern(movie)
+        return cached
 
     reader = ReadStatReader(read_stat_filename)
     for r in reader:
-        movie = r.name.split('/')[0]
-        if restricted_movies is None or movie in restricted_movies:
+        if restricted_movies is None or _movie_of(r.name) in restricted_movies:
             if r.pbid is not None:
                 if r.is_fl: # FL, must be uniquely mapped
                     assert r.is_uniquely_mapped
-                    tally[r.pbid]['fl'] += 1
+                    fl[_idx(r.pbid)] += 1
                     total_ids['fl'].add(r.name)
                 else: # non-FL, can be ambiguously mapped
                     if r.is_uniquely_mapped:
-                        tally[r.pbid]['nfl'] += 1
+                        nfl[_idx(r.pbid)] += 1
                         total_ids['nfl'].add(r.name)
                     else:
                         assert r.is_ambiguously_mapped
@@ -301,12 +388,76 @@ def make_abundance_file(read_stat_filename, output_filename, given_total=None,
                     total_ids['fl'].add(r.name)
                 else:
                     total_ids['nfl'].add(r.name)
+    reader.close()
 
     # put the ambiguous back in tally weighted
     for dummy_seqid, pbids in amb_count.iteritems():
         weight = 1. / len(pbids)
         for pbid in pbids:
-            tally[pbid]['nfl_amb'] += weight
+            nfl_amb[_idx(pbid)] += weight
+
+    return (pbid_to_idx, np.array(fl, dtype=np.int64), np.array(nfl, dtype=np.int64),
+            np.array(nfl_amb, dtype=np.float64), len(total_ids['fl']),
+            len(total_ids['nfl']), len(total_ids['nfl_amb']))
+
+
+def _tally_read_stats_with_pandas(read_stat_filename, restricted_movies=None):
+    """
+    Same as _tally_read_stats, but load the whole read status file
+    into a pandas.DataFrame and tally reads with groupby.
+    """
+    df = pd.read_csv(read_stat_filename, sep='\t', comment='#', dtype=str,
+                     keep_default_na=False)
+    if restricted_movies is not None:
+        movies = df['id'].str.split('/', n=1).str[0]
+        df = df[movies.isin(restricted_movies)]
+
+    is_fl = df['is_fl'].isin(['Y', 'True'])
+    is_mapped = ~df['pbid'].isin(['NA', 'None'])
+    is_unique = df['stat'] == MapStatus.UNIQUELY_MAPPED
+    is_amb = df['stat'] == MapStatus.AMBIGUOUSLY_MAPPED
+    # FL, must be uniquely mapped
+    assert not (is_fl & is_mapped & ~is_unique).any()
+    assert (is_fl | ~is_mapped | is_unique | is_amb).all()
+
+    fl = df[is_fl & is_mapped].groupby('pbid').size()
+    nfl = df[~is_fl & is_mapped & is_unique].groupby('pbid').size()
+    amb = df[~is_fl & is_mapped & is_amb]
+    # each ambiguous read contributes 1/(number of pbids it maps to)
+    weights = 1. / amb.groupby('id')['pbid'].transform('count')
+    nfl_amb = weights.groupby(amb['pbid']).sum()
+
+    pbids = fl.index.union(nfl.index).union(nfl_amb.index)
+    pbid_to_idx = dict((pbid, i) for i, pbid in enumerate(pbids))
+
+    # even if it is unmapped it still counts in the abundance total!
+    return (pbid_to_idx,
+            fl.reindex(pbids, fill_value=0).values.astype(np.int64),
+            nfl.reindex(pbids, fill_value=0).values.astype(np.int64),
+            nfl_amb.reindex(pbids, fill_value=0.).values.astype(np.float64),
+            df[is_fl]['id'].nunique(),
+            df[~is_fl & (is_unique | ~is_mapped)]['id'].nunique(),
+            amb['id'].nunique())
+
+
+def make_abundance_file(read_stat_filename, output_filename, given_total=None,
+                        restricted_movies=None, write_header_comments=True):
+    """
+    Make read mapping abundance file.
+    If given_total is not None, use it instead of the total count based on <read_stat_filename>
+    given_total should be dict of {fl, nfl, nfl_amb}
+    Parameters:
+      read_stat_filename - path to a read status file each line of which is a ReadStatRecord
+      output_filename - path to output abundance file.
+    """
+    if restricted_movies is not None:
+        restricted_movies = frozenset(intern(str(movie)) for movie in restricted_movies)
+
+    # tally reads with pandas if available, which is much faster on large files.
+    tally_read_stats = _tally_read_stats if pd is None else _tally_read_stats_with_pandas
+    pbid_to_idx, fl, nfl, nfl_amb, total_fl, total_nfl, total_nfl_amb = \
+            tally_read_stats(read_stat_filename=read_stat_filename,
+                             restricted_movies=restricted_movies)
 
     if given_total is not None:
         use_total_fl = given_total['fl']
@@ -314,9 +465,15 @@ def make_abundance_file(read_stat_filename, output_filename, given_total=None,
         # ToDo: the below is NOT EXACTLY CORRECT!! Fix later!
         use_total_nfl_amb = given_total['fl'] + given_total['nfl'] + given_total['nfl_amb']
     else:
-        use_total_fl = len(total_ids['fl'])
-        use_total_nfl = len(total_ids['fl']) + len(total_ids['nfl'])
-        use_total_nfl_amb = len(total_ids['fl']) + len(total_ids['nfl']) + len(total_ids['nfl_amb'])
+        use_total_fl = total_fl
+        use_total_nfl = total_fl + total_nfl
+        use_total_nfl_amb = total_fl + total_nfl + total_nfl_amb
+
+    # numpy would silently write inf or nan normalized counts.
+    if len(pbid_to_idx) > 0 and 0 in (use_total_fl, use_total_nfl, use_total_nfl_amb):
+        raise ZeroDivisionError("Could not normalize read counts in %s, total fl=%s, "
+                                "nfl=%s, nfl_amb=%s." % (read_stat_filename, use_total_fl,
+                                                         use_total_nfl, use_total_nfl_amb))
 
     comments = None
     if write_header_comments:
@@ -325,18 +482,24 @@ def make_abundance_file(read_stat_filename, output_filename, given_total=None,
     writer = AbundanceWriter(output_filename, comments=comments)
 
     #("pbid\tcount_fl\tcount_nfl\tcount_nfl_amb\tnorm_fl\tnorm_nfl\tnorm_nfl_amb\n")
-    keys = tally.keys()
-    keys.sort(key=lambda x: map(int, x.split('.')[1:])) # sort by PB.1, PB.2....
-    for pbid in keys:
-        v = tally[pbid]
-        count_fl = v['fl']
-        count_nfl = count_fl + v['nfl']
-        count_nfl_amb = count_nfl + v['nfl_amb']
-        norm_fl = count_fl*1./use_total_fl
-        norm_nfl = count_nfl*1./use_total_nfl
-        norm_nfl_amb = count_nfl_amb*1./use_total_nfl_amb
-        record = AbundanceRecord(pbid=pbid, count_fl=count_fl, count_nfl=count_nfl,
-                                 count_nfl_amb=count_nfl_amb, norm_fl=norm_fl,
-                                 norm_nfl=norm_nfl, norm_nfl_amb=norm_nfl_amb)
-        writer.writeRecord(record)
+    # sort by PB.1, PB.2...., parse each pbid exactly once
+    decorated = sorted((tuple(int(x) for x in pbid.split('.')[1:]), pbid)
+                       for pbid in pbid_to_idx)
+    keys = [pbid for dummy_key, pbid in decorated]
+    order = np.array([pbid_to_idx[pbid] for pbid in keys], dtype=np.int64)
+
+    count_fl = fl[order]
+    count_nfl = count_fl + nfl[order]
+    count_nfl_amb = count_nfl + nfl_amb[order]
+    norm_fl = count_fl * 1. / use_total_fl
+    norm_nfl = count_nfl * 1. / use_total_nfl
+    norm_nfl_amb = count_nfl_amb * 1. / use_total_nfl_amb
+
+    writer.writeRecords(
+        AbundanceRecord(pbid=pbid, count_fl=int(count_fl[i]),
+                        count_nfl=int(count_nfl[i]),
+                        count_nfl_amb=float(count_nfl_amb[i]),
+                        norm_fl=float(norm_fl[i]), norm_nfl=float(norm_nfl[i]),
+                        norm_nfl_amb=float(norm_nfl_amb[i]))
+        for i, pbid in enumerate(keys))
     writer.close()
@@ -47,6 +47,7 @@ class IceFiles(object):
         self.prog_name = str(prog_name)
         self.root_dir = real_ppath(root_dir)
         self._tmp_dir = real_ppath(tmp_dir)
+        self._cluster_dirs = {} # (tmp_dir, cid) -> cluster_dir(cid)
 
         self.bas_fofn = real_ppath(bas_fofn)
         self.ccs_fofn = real_ppath(ccs_fofn)
@@ -166,7 +167,17 @@ class IceFiles(object):
 
     def cluster_dir(self, cid):
         """Return directory path for the i-th cluster, i in [0,...]"""
-        return op.join(self.tmp_dir, str(int(cid) / 10000), 'c' + str(cid))
+        # Called for every per-cluster file, cache paths by tmp_dir and cid.
+        # Bound the cache, IceIterative may touch millions of clusters.
+        tmp_dir = self.tmp_dir
+        key = (tmp_dir, cid)
+        path = self._cluster_dirs.get(key)
+        if path is None:
+            if len(self._cluster_dirs) >= 65536:
+                self._cluster_dirs.clear()
+            path = op.join(tmp_dir, str(int(cid) / 10000), 'c' + str(cid))
+            self._cluster_dirs[key] = path
+        return path
 
     def raw_fa_of_cluster(self, cid):
         """Return $cluster_dir/in.raw_with_partial.fasta, which
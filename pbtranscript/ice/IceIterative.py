@@ -24,7 +24,8 @@ from pbtranscript.ice.IceUtils import sanity_check_gcon, \
     sanity_check_sge, possible_merge, blasr_against_ref, \
     get_the_only_fasta_record, cid_with_annotation, \
     daligner_against_ref, ice_fa2fq, fafn2fqfn, \
-    set_probqv_from_ccs, set_probqv_from_fq, set_probqv_from_model
+    set_probqv_from_ccs, set_probqv_from_fq, set_probqv_from_model, \
+    write_sorted_cids
 
 
 random.seed(0)
@@ -383,10 +384,12 @@ class IceIterative(IceFiles):
         msg = "Writing final pickle to {f}".format(f=final_pickle_fn)
         self.add_log(msg, level=logging.INFO)
         self.write_pickle(final_pickle_fn)
+        if not final_pickle_fn.endswith(".json"):
+            write_sorted_cids(uc=self.uc, pickle_fn=final_pickle_fn)
 
     def write_pickle(self, pickle_filename):
         """Write an instance of IceIterative to a pickle file."""
-        with open(pickle_filename, 'w') as f:
+        with open(pickle_filename, 'wb') as f:
             d = {'uc': self.uc,
                  'd': self.d,
                  'refs': self.refs,
@@ -403,7 +406,7 @@ class IceIterative(IceFiles):
             else:
                 d.update({'ice_opts': self.ice_opts,
                           'sge_opts': self.sge_opts})
-                cPickle.dump(d, f)
+                cPickle.dump(d, f, cPickle.HIGHEST_PROTOCOL)
 
     def make_new_cluster(self):
         """Add a new cluster to self.uc."""
@@ -50,7 +50,7 @@ import os
 import os.path as op
 import time
 import logging
-from cPickle import dump
+from cPickle import dump, HIGHEST_PROTOCOL
 import json
 
 from pbcommand.models import FileTypes
@@ -170,9 +170,10 @@ def build_uc_from_partial_daligner(input_fasta, ref_fasta, out_pickle,
     nohit = allhits.difference(seen)
 
     logging.info("Dumping uc to a pickle: %s.", out_pickle)
-    with open(out_pickle, 'w') as f:
+    with open(out_pickle, 'wb') as f:
         if out_pickle.endswith(".pickle"):
-            dump({'partial_uc': partial_uc, 'nohit': nohit}, f)
+            dump({'partial_uc': partial_uc, 'nohit': nohit}, f,
+                 HIGHEST_PROTOCOL)
         elif out_pickle.endswith(".json"):
             f.write(json.dumps({'partial_uc': partial_uc, 'nohit': nohit}))
         else:
@@ -269,9 +270,10 @@ def build_uc_from_partial(input_fasta, ref_fasta, out_pickle,
     nohit = allhits.difference(seen)
 
     logging.info("Dumping uc to a pickle: %s.", out_pickle)
-    with open(out_pickle, 'w') as f:
+    with open(out_pickle, 'wb') as f:
         if out_pickle.endswith(".pickle"):
-            dump({'partial_uc': partial_uc, 'nohit': nohit}, f)
+            dump({'partial_uc': partial_uc, 'nohit': nohit}, f,
+                 HIGHEST_PROTOCOL)
         elif out_pickle.endswith(".json"):
             f.write(json.dumps({'partial_uc': partial_uc, 'nohit': nohit}))
         else:
@@ -9,23 +9,42 @@ import os.path as op
 import logging
 import shutil
 import cPickle
-import json
+import hashlib
 from math import ceil
 from collections import defaultdict
+from multiprocessing.pool import ThreadPool
+try:
+    import ujson as json
+except ImportError:
+    import json
 
 from pbtranscript.ClusterOptions import IceQuiverOptions
 from pbtranscript.PBTranscriptOptions import  add_fofn_arguments, \
     add_sge_arguments, add_cluster_root_dir_as_positional_argument
 from pbtranscript.Utils import mkdir, real_upath, nfs_exists, \
-    get_files_from_file_or_fofn, guess_file_format, FILE_FORMATS, \
+    guess_file_format, FILE_FORMATS, \
     use_samtools_v_1_3_1
 from pbtranscript.ice.IceUtils import get_the_only_fasta_record, \
     is_blank_sam, concat_sam, blasr_for_quiver, trim_subreads_and_write, \
-    is_blank_bam, concat_bam
+    is_blank_bam, concat_bam, read_sorted_cids
 from pbtranscript.ice.IceFiles import IceFiles
-from pbtranscript.io import MetaSubreadFastaReader, BamCollection, \
-    FastaRandomReader
-from pbcore.io import FastaWriter
+from pbtranscript.io import BamCollection
+from pbcore.io import FastaReader
+
+
+def _blasr_for_quiver_task(task):
+    """Align (query_fn, ref_fasta, out_fn, bam) using a single thread."""
+    query_fn, ref_fasta, out_fn, bam = task
+    return blasr_for_quiver(query_fn=query_fn, ref_fasta=ref_fasta,
+                            out_fn=out_fn, bam=bam, run_cmd=True,
+                            blasr_nproc=1)
+
+
+def _iter_bin_cids(keys, start, end, bin_size=100):
+    """Yield keys[start:end] in slices of at most bin_size cluster ids,
+    each slice is a quiver bin."""
+    for i in xrange(start, end, bin_size):
+        yield keys[i:min(end, i + bin_size)]
 
 
 class IceQuiver(IceFiles):
@@ -45,6 +64,14 @@ class IceQuiver(IceFiles):
                                         fasta_fofn=fasta_fofn, tmp_dir=tmp_dir)
         self.sge_opts = sge_opts
         self.use_samtools_v_1_3_1 = use_samtools_v_1_3_1()
+        self._bas_fofn_format = None
+
+    @property
+    def bas_fofn_format(self):
+        """Return guess_file_format(bas_fofn), which is only computed once."""
+        if self._bas_fofn_format is None:
+            self._bas_fofn_format = guess_file_format(self.bas_fofn)
+        return self._bas_fofn_format
 
     def validate_inputs(self):
         """Validate input fofns, and root_dir, log_dir, tmp_dir,
@@ -80,20 +107,11 @@ class IceQuiver(IceFiles):
                      "which assigns full-length non-chimeric reads to " + \
                      "isoforms does not exist."
 
-        if self.bas_fofn is not None and \
-            guess_file_format(self.bas_fofn) is not FILE_FORMATS.BAM:
-            # No need to convert subreads.bam to fasta
-            if self.fasta_fofn is None:
-                errMsg = "Please make sure ice_make_fasta_fofn has " + \
-                         "been called, and specify fasta_fofn."
-            elif not nfs_exists(self.fasta_fofn):
-                errMsg = "Input fasta_fofn {f} does not exists.".\
-                         format(f=self.fasta_fofn)
-                fasta_files = get_files_from_file_or_fofn(self.fasta_fofn)
-                for fasta_file in fasta_files:
-                    if not nfs_exists(fasta_file):
-                        errMsg = "A file {f} in fasta_fofn does not exist.".\
-                                 format(f=fasta_file)
+        if errMsg == "" and self.bas_fofn_format is not FILE_FORMATS.BAM:
+            # Quiver/Arrow polishing only supports subreads in BAM
+            errMsg = "Subreads file (bas_fofn={f}) must be ".format(f=self.bas_fofn) + \
+                     "subreads.bam files or a subreadset.xml, " + \
+                     "polishing from bax.h5 or FASTA is no longer supported."
 
         if errMsg != "":
             self.add_log(errMsg, level=logging.ERROR)
@@ -139,6 +157,12 @@ class IceQuiver(IceFiles):
         """Return $_quivered_bin_prefix.sh"""
         return self._quivered_bin_prefix(first, last) + ".sh"
 
+    def script_of_quivered_batch(self, first, last):
+        """Return $_quivered_bin_prefix.batch.sh, a script running
+        scripts of all quivered bins from c{first} to c{last} in one
+        SGE job."""
+        return self._quivered_bin_prefix(first, last) + ".batch.sh"
+
     def reconstruct_ref_fa_for_clusters_in_bin(self, cids, refs):
         """
         Reconstruct ref_fa of the cluster in the new tmp_dir
@@ -157,20 +181,34 @@ class IceQuiver(IceFiles):
                      "[%d, %d] in %s" % (cids[0], cids[-1], self.tmp_dir),
                      level=logging.INFO)
 
-        final_consensus_d = FastaRandomReader(self.final_consensus_fa)
-        for ref_id in final_consensus_d.d.keys():
-            cid = int(ref_id.split('/')[0].replace('c', ''))
+        cids_set = frozenset(cids)
+        # Each mkdir is a round trip on NFS, overlap them using threads.
+        pool = ThreadPool(processes=max(1, min(16, len(cids_set))))
+        try:
+            pool.map(mkdir, [self.cluster_dir(cid) for cid in cids_set])
+        finally:
+            pool.close()
+            pool.join()
+
+        # A single sequential pass over final consensus, no index needed.
+        # Stop as soon as every cluster in cids has been written.
+        num_todo = len(cids_set)
+        for rec in FastaReader(self.final_consensus_fa):
+            ref_id = rec.id
+            cid = int(ref_id.split('/', 1)[0][1:])
             # e.g., ref_id = c103/1/3708, cid = 103,
             #       refs[cid] = ...tmp/0/c103/g_consensus_ref.fasta
-            if cid in cids:
-                mkdir(self.cluster_dir(cid))
+            if cid in cids_set:
                 ref_fa = op.join(self.cluster_dir(cid),
                                  op.basename(refs[cid]))
                 refs[cid] = ref_fa
-                with FastaWriter(ref_fa) as writer:
-                    self.add_log("Writing ref_fa %s" % refs[cid])
-                    writer.writeRecord(ref_id,
-                                       final_consensus_d[ref_id].sequence[:])
+                # Unwrapped FASTA is fine for blasr, write it directly
+                self.add_log("Writing ref_fa %s" % refs[cid])
+                with open(ref_fa, 'w') as writer:
+                    writer.write(">%s\n%s\n" % (ref_id, rec.sequence))
+                num_todo -= 1
+                if num_todo == 0:
+                    break
 
         self.add_log("Reconstruct of g consensus files completed.",
                      level=logging.INFO)
@@ -184,7 +222,7 @@ class IceQuiver(IceFiles):
           in either uc or partial_uc.
 
         cids --- cluster ids
-        d --- MetaSubreadFastaReader or BamCollection
+        d --- BamCollection
         uc --- uc[k] returns fl ccs reads associated with cluster k
         partial_uc --- partial_uc[k] returns nfl ccs reads associated with cluster k
         """
@@ -222,6 +260,7 @@ class IceQuiver(IceFiles):
         out_file_func = self.sam_of_cluster if not bam else \
                         self.bam_of_cluster
 
+        tasks = []
         for k in cids:  # for each cluster k
 
             # $root_dir/tmp/?/c{k}/in.raw_with_partial.fasta
@@ -231,14 +270,25 @@ class IceQuiver(IceFiles):
             if not op.exists(raw_fn):
                 raise IOError("{f} does not exist. ".format(f=raw_fn) +
                               "Please check raw subreads of this bin is created.")
-            blasr_for_quiver(
-                query_fn=raw_fn,
-                ref_fasta=refs[k],
-                out_fn=out_fn,
-                bam=bam,
-                run_cmd=True,
-                blasr_nproc=self.sge_opts.blasr_nproc)
-
+            tasks.append((raw_fn, refs[k], out_fn, bam))
+
+        if len(tasks) == 0:
+            return
+
+        # Run many single-threaded blasr jobs at the same time instead of
+        # one multi-threaded job per cluster, keeping the total number of
+        # threads at blasr_nproc. Align largest clusters first so that the
+        # pool is not left waiting on a long job at the end.
+        # blasr runs in a subprocess, so threads are enough here and do not
+        # copy the memory of this process as forked workers would.
+        tasks.sort(key=lambda t: op.getsize(t[0]), reverse=True)
+        num_threads = max(1, min(self.sge_opts.blasr_nproc, len(tasks)))
+        pool = ThreadPool(processes=num_threads)
+        try:
+            pool.map(_blasr_for_quiver_task, tasks)
+        finally:
+            pool.close()
+            pool.join()
 
     def concat_valid_sams_and_refs_for_bin(self, cids, refs, bam=False):
         """
@@ -268,29 +318,33 @@ class IceQuiver(IceFiles):
                      "{first} and {last}.".format(first=first, last=last))
         valid_sam_files = []
         valid_cids = []
-        seqs_seen = {}
-        with open(bin_ref_fa, 'w') as bin_ref_fa_writer:
-            for cid in cids:
-                fname = file_func(cid)
-                if not is_blank_file(fname):
-                    ref_rec = get_the_only_fasta_record(refs[cid])
-                    name = ref_rec.name.strip()
-                    seq = ref_rec.sequence.strip()
-                    if seq not in seqs_seen:
-                        valid_sam_files.append(fname)
-                        valid_cids.append(cid)
-                        seqs_seen[seq] = cid
-                        # concate valid ref files, avoid 'cat ...' hundreds
-                        # or even thousands of files due to linux cmd line
-                        # length limits
-                        bin_ref_fa_writer.write(">{0}\n{1}\n".
-                                                format(name, seq))
-                    else:
-                        self.add_log("ignoring {0} because identical " +
-                                     "sequence!".format(cid))
+        seqs_seen = set()  # md5 digests of valid ref sequences
+        ref_lines = []
+        for cid in cids:
+            fname = file_func(cid)
+            if not is_blank_file(fname):
+                ref_rec = get_the_only_fasta_record(refs[cid])
+                name = ref_rec.name.strip()
+                seq = ref_rec.sequence.strip()
+                seq_digest = hashlib.md5(seq).digest()
+                if seq_digest not in seqs_seen:
+                    valid_sam_files.append(fname)
+                    valid_cids.append(cid)
+                    seqs_seen.add(seq_digest)
+                    # concate valid ref files, avoid 'cat ...' hundreds
+                    # or even thousands of files due to linux cmd line
+                    # length limits
+                    ref_lines.append(">%s\n%s\n" % (name, seq))
                 else:
-                    self.add_log(
-                        "ignoring {0} because no alignments!".format(cid))
+                    self.add_log("ignoring {0} because identical " +
+                                 "sequence!".format(cid))
+            else:
+                self.add_log(
+                    "ignoring {0} because no alignments!".format(cid))
+
+        # Write all valid refs of this bin at once.
+        with open(bin_ref_fa, 'w') as bin_ref_fa_writer:
+            bin_ref_fa_writer.write(''.join(ref_lines))
 
         if len(valid_sam_files) == 0:
             self.add_log("No alignments were found for clusters between " +
@@ -326,7 +380,9 @@ class IceQuiver(IceFiles):
         bin_bam_file = self.bam_of_quivered_bin(first, last, is_sorted=True)
         bin_bam_prefix = self._quivered_bin_prefix(first, last)
 
-        quiver_input = bin_cmph5 if not bam else bin_bam_file
+        # Resolve each path once, they are used by several cmds.
+        u_bam = real_upath(bin_bam_file)
+        u_ref = real_upath(bin_ref_fa)
 
         cmds = []
         if not bam:
@@ -348,25 +404,25 @@ class IceQuiver(IceFiles):
                         format(bas_fofn=real_upath(self.bas_fofn),
                                cmph5=real_upath(bin_cmph5)))
         else:
+            u_unsorted_bam = real_upath(bin_unsorted_bam_file)
+            u_bam_prefix = real_upath(bin_bam_prefix)
             if not self.use_samtools_v_1_3_1:
                 # SA2.*, SA3.0, SA3.1 and SA3.2 use v0.1.19
                 cmds.append("samtools sort {f} {d}".format(
-                    f=real_upath(bin_unsorted_bam_file),
-                    d=real_upath(bin_bam_prefix)))
+                    f=u_unsorted_bam, d=u_bam_prefix))
             else:
-                # SA3.3 and up use v1.3.1
-                cmds.append("samtools sort {f} -o {d}.bam".format(
-                    f=real_upath(bin_unsorted_bam_file),
-                    d=real_upath(bin_bam_prefix)))
+                # SA3.3 and up use v1.3.1, sort with quiver_nproc threads
+                cmds.append("samtools sort -@ {n} {f} -o {d}.bam".format(
+                    n=quiver_nproc, f=u_unsorted_bam, d=u_bam_prefix))
 
-            cmds.append("samtools index {f}".format(f=real_upath(bin_bam_file)))
+            cmds.append("samtools index {f}".format(f=u_bam))
 
-        cmds.append("samtools faidx {ref}".format(ref=real_upath(bin_ref_fa)))
-        cmds.append("pbindex {f}".format(f=real_upath(bin_bam_file)))
+        cmds.append("samtools faidx {ref}".format(ref=u_ref))
+        cmds.append("pbindex {f}".format(f=u_bam))
         cmds.append("variantCaller --algorithm=best " +
-                    "{f} ".format(f=real_upath(quiver_input)) +
+                    "{f} ".format(f=u_bam) +
                     "--verbose -j{n} ".format(n=quiver_nproc) +
-                    "--referenceFilename={ref} ".format(ref=real_upath(bin_ref_fa)) +
+                    "--referenceFilename={ref} ".format(ref=u_ref) +
                     "-o {fq}".format(fq=real_upath(bin_fq)))
         return cmds
 
@@ -385,6 +441,35 @@ class IceQuiver(IceFiles):
 
         return bin_sh
 
+    def _local_quiver_cmd(self, job):
+        """Return a cmd to run a quiver script locally, logging to
+        quivered_log_dir/<job>.olog|elog, and the two log files."""
+        elog = op.join(self.quivered_log_dir, op.basename(job) + ".elog")
+        olog = op.join(self.quivered_log_dir, op.basename(job) + ".olog")
+        cmd = "bash " + real_upath(job) + " 1>{olog} 2>{elog}".\
+              format(olog=real_upath(olog), elog=real_upath(elog))
+        return cmd, olog, elog
+
+    def _qsub_quiver_script(self, job, sge_opts):
+        """Submit a quiver script to SGE, return its job id."""
+        # ex: Your job 8613116 ("c20to70.sh") has been submitted
+        elog = op.join(self.quivered_log_dir,
+                       op.basename(job) + ".elog")
+        olog = op.join(self.quivered_log_dir,
+                       op.basename(job) + ".olog")
+        jid = "ice_quiver_{unique_id}_{name}".format(
+            unique_id=self.sge_opts.unique_id,
+            name=op.basename(job))
+        qsub_cmd = "qsub " + \
+                   "-pe smp {n} ".\
+                   format(n=sge_opts.quiver_nproc) + \
+                   "-cwd -S /bin/bash -V " + \
+                   "-e {elog} ".format(elog=real_upath(elog)) +\
+                   "-o {olog} ".format(olog=real_upath(olog)) +\
+                   "-N {jid} ".format(jid=jid) + \
+                   "{job}".format(job=real_upath(job))
+        return self.qsub_cmd_and_log(qsub_cmd)
+
     def submit_todo_quiver_jobs(self, todo, submitted, sge_opts):
         """
         todo --- a list of sh scripts to run
@@ -399,44 +484,51 @@ class IceQuiver(IceFiles):
         if sge_opts.use_sge is not True or \
            sge_opts.max_sge_jobs == 0:  # don't use SGE
             for job in todo:
-                elog = op.join(self.quivered_log_dir,
-                               op.basename(job) + ".elog")
-                olog = op.join(self.quivered_log_dir,
-                               op.basename(job) + ".olog")
-                cmd = "bash " + real_upath(job) + " 1>{olog} 2>{elog}".\
-                      format(olog=real_upath(olog), elog=real_upath(elog))
+                cmd, olog, elog = self._local_quiver_cmd(job)
                 self.run_cmd_and_log(cmd, olog=olog, elog=elog,
                                      description="Failed to run Quiver")
                 submitted.append(("local", job))
             todo = []
         else:
-            while len(todo) > 0:
-                n = min(sge_opts.max_sge_jobs, len(todo))
-                for job in todo[:n]:
-                    # ex: Your job 8613116 ("c20to70.sh") has been submitted
-                    elog = op.join(self.quivered_log_dir,
-                                   op.basename(job) + ".elog")
-                    olog = op.join(self.quivered_log_dir,
-                                   op.basename(job) + ".olog")
-                    jid = "ice_quiver_{unique_id}_{name}".format(
-                        unique_id=self.sge_opts.unique_id,
-                        name=op.basename(job))
-                    qsub_cmd = "qsub " + \
-                               "-pe smp {n} ".\
-                               format(n=sge_opts.quiver_nproc) + \
-                               "-cwd -S /bin/bash -V " + \
-                               "-e {elog} ".format(elog=real_upath(elog)) +\
-                               "-o {olog} ".format(olog=real_upath(olog)) +\
-                               "-N {jid} ".format(jid=jid) + \
-                               "{job}".format(job=real_upath(job))
-                    job_id = self.qsub_cmd_and_log(qsub_cmd)
-
-                    submitted.append((job_id, job))
-                    todo.remove(job)
-                # end of for job in todo[:n]
-            # end of while len(todo) > 0
+            # Jobs are submitted in order without waiting between them,
+            # so a single pass over todo is all that is needed.
+            for job in todo:
+                job_id = self._qsub_quiver_script(job, sge_opts)
+                submitted.append((job_id, job))
+            # end of for job in todo
         # end of else (use sge)
 
+    def submit_batch_of_quiver_jobs(self, batch, submitted, sge_opts):
+        """
+        batch --- a list of (cids, sh script) of quivered bins
+        submitted --- a list of sh scripts which have been submitted
+        sge_opts --- SGE options, see submit_todo_quiver_jobs.
+
+        When using SGE and batch has more than one script, write a
+        script_of_quivered_batch which runs them one after another and
+        qsub it once, so that they share one scheduler round-trip. Every
+        script in batch is recorded in submitted with the batch job id.
+        Otherwise, same as submit_todo_quiver_jobs.
+        """
+        todo = [bin_sh for (_cids, bin_sh) in batch]
+        if len(todo) <= 1 or sge_opts.use_sge is not True or \
+           sge_opts.max_sge_jobs == 0:
+            self.submit_todo_quiver_jobs(todo=todo, submitted=submitted,
+                                         sge_opts=sge_opts)
+            return
+
+        batch_sh = self.script_of_quivered_batch(batch[0][0][0], batch[-1][0][-1])
+        self.add_log("Creating quiver batch script {f} for {n} quiver jobs.".
+                     format(f=batch_sh, n=len(todo)))
+        with open(batch_sh, 'w') as f:
+            f.write("#!/bin/bash\n")
+            # Run every job even if a previous one failed, failed jobs
+            # will be reported by IceQuiverPostprocess.
+            f.writelines(self._local_quiver_cmd(job)[0] + "\n" for job in todo)
+
+        job_id = self._qsub_quiver_script(batch_sh, sge_opts)
+        submitted.extend((job_id, job) for job in todo)
+
     def create_a_quiver_bin(self, cids, d, uc, partial_uc, refs, sge_opts):
         """Put clusters in cids together into a bin. In order to polish
         consensus of clusters in the bin, prepare inputs and create a quiver
@@ -455,15 +547,14 @@ class IceQuiver(IceFiles):
               * qsub all jobs later when scripts of all quivered bins are done.
               * or execute scripts sequentially on local machine
         """
-        if not isinstance(d, BamCollection) and \
-           not isinstance(d, MetaSubreadFastaReader):
+        if not isinstance(d, BamCollection):
             raise TypeError("%s.create_a_quiver_bin, does not support %s" %
                             (self.__class__.__name__, type(d)))
 
         self.add_log("Creating a quiver job bin for clusters "
                      "[%s, %s]" % (cids[0], cids[-1]), level=logging.INFO)
 
-        bam = True if isinstance(d, BamCollection) else False
+        bam = True
 
         # For each cluster in bin, create its raw subreads fasta file.
         self.create_raw_files_for_clusters_in_bin(cids=cids, d=d, uc=uc,
@@ -499,12 +590,11 @@ class IceQuiver(IceFiles):
         Return a list of scripts to run.
         """
         bin_scripts = []
-        for i in xrange(start, end, 100):  # Put every 100 clusters to a bin
-            cids = keys[i:min(end, i + 100)]
+        for cids in _iter_bin_cids(keys, start, end):
             bin_sh = self.create_a_quiver_bin(cids=cids, d=d, uc=uc,
                                               partial_uc=partial_uc,
                                               refs=refs, sge_opts=sge_opts)
-            bin_scripts += bin_sh
+            bin_scripts.append(bin_sh)
         return bin_scripts
 
     def create_quiver_bins_and_submit_jobs(self, d, uc, partial_uc, refs, keys,
@@ -528,17 +618,24 @@ class IceQuiver(IceFiles):
                                                         refs=refs)
 
         all_todo = []
-        for i in xrange(start, end, 100):  # Put every 100 clusters to a bin
-            cids = keys[i:min(end, i + 100)]
+        batch = []
+        jobs_per_qsub = max(1, sge_opts.jobs_per_qsub)
+        for cids in _iter_bin_cids(keys, start, end):
             bin_sh = self.create_a_quiver_bin(cids=cids, d=d, uc=uc,
                                               partial_uc=partial_uc,
                                               refs=refs, sge_opts=sge_opts)
             all_todo.append(bin_sh)
             # assert bin_sh == self.script_of_quivered_bin(first, last)
-            # submit the created script of this quiver bin
-            self.submit_todo_quiver_jobs(todo=[bin_sh], submitted=submitted,
-                                         sge_opts=sge_opts)
-        # end of for i in xrange(start, end, 100):
+            # submit created scripts once a batch of quiver bins is ready
+            batch.append((cids, bin_sh))
+            if len(batch) >= jobs_per_qsub:
+                self.submit_batch_of_quiver_jobs(batch=batch, submitted=submitted,
+                                                 sge_opts=sge_opts)
+                batch = []
+        # end of for cids in _iter_bin_cids(keys, start, end)
+        if len(batch) > 0:
+            self.submit_batch_of_quiver_jobs(batch=batch, submitted=submitted,
+                                             sge_opts=sge_opts)
         return all_todo
 
     @property
@@ -552,9 +649,11 @@ class IceQuiver(IceFiles):
         """
         def _load_pickle(fn):
             """Load *.json or *.pickle file."""
-            with open(fn) as f:
+            # cPickle reads real file objects through stdio directly, so
+            # a large stdio buffer is all it needs.
+            with open(fn, 'rb', 1 << 22) as f:
                 if fn.endswith(".json"):
-                    return json.loads(f.read())
+                    return json.load(f)
                 else:
                     return cPickle.load(f)
         self.add_log("Loading uc from {f}.".format(f=self.final_pickle_fn))
@@ -565,21 +664,20 @@ class IceQuiver(IceFiles):
         self.add_log("Loading partial uc from {f}.".
                      format(f=self.nfl_all_pickle_fn))
         partial_uc = _load_pickle(self.nfl_all_pickle_fn)['partial_uc']
-        partial_uc2 = defaultdict(lambda: [])
-        partial_uc2.update(partial_uc)
+        partial_uc2 = defaultdict(list, partial_uc)
         return (uc, partial_uc2, refs)
 
     def index_input_subreads(self):
-        """Index input subreads in self.fasta_fofn or self.bas_fofn.
+        """Index input subreads in self.bas_fofn, which must be BAM.
         """
-        if guess_file_format(self.bas_fofn) == FILE_FORMATS.BAM:
-            msg = "Indexing files in %s, please wait." % self.bas_fofn
-            self.add_log(msg)
-            d = BamCollection(self.bas_fofn)
-        else:
-            msg = "Indexing files in %s, please wait." % self.fasta_fofn
-            self.add_log(msg)
-            d = MetaSubreadFastaReader(get_files_from_file_or_fofn(self.fasta_fofn))
+        if self.bas_fofn_format != FILE_FORMATS.BAM:
+            raise IOError("%s.index_input_subreads only supports " %
+                          self.__class__.__name__ +
+                          "subreads.bam or subreadset.xml, not %s." %
+                          self.bas_fofn)
+        msg = "Indexing files in %s, please wait." % self.bas_fofn
+        self.add_log(msg)
+        d = BamCollection(self.bas_fofn)
 
         self.add_log("File indexing done.")
         return d
@@ -608,7 +706,7 @@ class IceQuiver(IceFiles):
         of roughly the same size, and are processing the i-th workload
         now.
         (1) load uc, partial_uc and refs from pickles and index subreads
-            in fasta and save to d
+            in fasta and save to d, unless the i-th part is empty
         (2) write report if this is the first chunk (e.g, i==0)
         (3) Assume clusters are divided into num_chunks parts, process
             the i-th part.
@@ -617,20 +715,15 @@ class IceQuiver(IceFiles):
             raise ValueError("Chunk index {i} should be less than {N}.".
                              format(i=i, N=num_chunks))
 
-        # load uc, partial_uc and refs from pickles,
-        uc, partial_uc, refs = self.load_pickles()
-
-        # Write report to quivered/cluster_report.FL_nonFL.csv
-        if i == 0:
-            self.write_report(report_fn=self.report_fn,
-                              uc=uc, partial_uc=partial_uc)
-
-        # Index input subreads in fasta_fofn or bas_fofn,
-        d = self.index_input_subreads()
-
-        # good = [x for x in uc if len(uc[x]) > 1 or len(partial_uc2[x]) >= 10]
-        # bug 24984, call quiver on everything, no selection is needed.
-        keys = sorted([x for x in uc])  # sort cluster ids
+        # Sorted cluster ids are saved next to the final pickle, so chunks
+        # which have no clusters to process need not load any pickles.
+        keys = read_sorted_cids(self.final_pickle_fn)
+        uc = None
+        if keys is None:
+            uc, partial_uc, refs = self.load_pickles()
+            # good = [x for x in uc if len(uc[x]) > 1 or len(partial_uc2[x]) >= 10]
+            # bug 24984, call quiver on everything, no selection is needed.
+            keys = sorted(uc)  # sort cluster ids
 
         # Compute number of clusters in i-th chunk
         num_clusters_per_chunk = int(ceil(len(keys) / float(num_chunks)))
@@ -639,11 +732,25 @@ class IceQuiver(IceFiles):
         start = i * num_clusters_per_chunk
         end = start + num_clusters_in_chunk_i
 
+        if uc is None and (i == 0 or start < end):
+            # load uc, partial_uc and refs from pickles,
+            uc, partial_uc, refs = self.load_pickles()
+
+        # Write report to quivered/cluster_report.FL_nonFL.csv
+        if i == 0:
+            self.write_report(report_fn=self.report_fn,
+                              uc=uc, partial_uc=partial_uc)
+
+        all_todo = []
         submitted = []
-        # Create quiver bins and submit jobs
-        all_todo = self.create_quiver_bins_and_submit_jobs(d=d, uc=uc,
-                                                           partial_uc=partial_uc, refs=refs, keys=keys, start=start,
-                                                           end=end, submitted=submitted, sge_opts=self.sge_opts)
+        if start < end:
+            # Index input subreads in bas_fofn,
+            d = self.index_input_subreads()
+
+            # Create quiver bins and submit jobs
+            all_todo = self.create_quiver_bins_and_submit_jobs(d=d, uc=uc,
+                                                               partial_uc=partial_uc, refs=refs, keys=keys, start=start,
+                                                               end=end, submitted=submitted, sge_opts=self.sge_opts)
 
         # Write submitted quiver jobs to
         # $root_dir/log/submitted_quiver_jobs.{i}of{num_chunks}.txt
@@ -651,15 +758,15 @@ class IceQuiver(IceFiles):
             i=i, num_chunks=num_chunks)
         self.add_log("Writing submitted quiver jobs to {f}".format(f=log_name))
         with open(log_name, 'w') as f:
-            f.write("\n".join(str(x[0]) + '\t' + str(x[1]) for x in submitted))
+            f.write("\n".join("%s\t%s" % (job_id, job) for (job_id, job) in submitted))
 
         # Write all quiver jobs of this workload to
         # $root_dir/log/quiver_jobs.{i}of{num_chunks}.sh
         sh_name = self.quiver_jobs_sh_of_chunk_i(i=i, num_chunks=num_chunks)
         self.add_log("Writing all quiver jobs to {f}".format(f=sh_name))
         with open(sh_name, 'w') as f:
-            assert isinstance(all_todo, list)
-            f.write("\n".join(["bash " + str(x) for x in all_todo]))
+            # all_todo is a list of script paths
+            f.writelines("bash %s\n" % x for x in all_todo)
 
     def run(self):
         """Run quiver to polish all consensus isoforms predicted by ICE."""
@@ -682,5 +789,6 @@ def add_ice_quiver_arguments(parser):
     """Add arguments for IceQuiver, not including IceQuiverPostprocess."""
     parser = add_cluster_root_dir_as_positional_argument(parser)
     parser = add_fofn_arguments(parser, bas_fofn=True)
-    parser = add_sge_arguments(parser, quiver_nproc=True, blasr_nproc=True)
+    parser = add_sge_arguments(parser, quiver_nproc=True, blasr_nproc=True,
+                               jobs_per_qsub=True)
     return parser
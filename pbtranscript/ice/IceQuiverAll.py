@@ -126,26 +126,26 @@ class IceQuiverAll(object):
     def _cmd_str(self, root_dir, bas_fofn, fasta_fofn, sge_opts, ipq_opts,
                  report_fn, summary_fn, tmp_dir):
         """Return a cmd string. ($ICE_QUIVER_PY all)."""
-        cmd = self.prog + \
-              "{d} ".format(d=root_dir) + \
-              "--bas_fofn={f} ".format(f=bas_fofn) + \
-              "--fasta_fofn={f} ".format(f=fasta_fofn)
+        args = ["{d}".format(d=root_dir),
+                "--bas_fofn={f}".format(f=bas_fofn),
+                "--fasta_fofn={f}".format(f=fasta_fofn)]
         if tmp_dir is not None:
-            cmd += "--tmp_dir={d} ".format(d=tmp_dir)
+            args.append("--tmp_dir={d}".format(d=tmp_dir))
         if report_fn is not None:
-            cmd += "--report={f} ".format(f=report_fn)
+            args.append("--report={f}".format(f=report_fn))
         if summary_fn is not None:
-            cmd += "--summary={f} ".format(f=summary_fn)
-        cmd += sge_opts.cmd_str(show_blasr_nproc=True, show_quiver_nproc=True)
-        cmd += ipq_opts.cmd_str()
-        return cmd
+            args.append("--summary={f}".format(f=summary_fn))
+        return "".join([self.prog, " ".join(args), " ",
+                        sge_opts.cmd_str(show_blasr_nproc=True, show_quiver_nproc=True,
+                                         show_jobs_per_qsub=True),
+                        ipq_opts.cmd_str()])
 
     def run(self):
         """Run"""
         iceq = IceQuiver(root_dir=self.root_dir, bas_fofn=self.bas_fofn,
                          fasta_fofn=self.fasta_fofn, sge_opts=self.sge_opts,
                          tmp_dir=self.tmp_dir)
-        iceq.validate_inputs()
+        # IceQuiver.run validates inputs itself.
         iceq.run()
 
         icepq = IceQuiverPostprocess(root_dir=self.root_dir,
@@ -167,6 +167,6 @@ def add_ice_quiver_all_arguments(parser):
     tcp_parser = add_cluster_summary_report_arguments(_wrap_parser(arg_parser))
     arg_parser = add_ice_post_quiver_hq_lq_arguments(arg_parser)
     arg_parser = add_sge_arguments(arg_parser, quiver_nproc=True,
-                                   blasr_nproc=True)
+                                   blasr_nproc=True, jobs_per_qsub=True)
     arg_parser = add_tmp_dir_argument(arg_parser)
     return parser
@@ -151,7 +151,8 @@ def add_ice_quiver_i_arguments(parser):
     parser.add_argument("i", nargs="+", help=helpstr, type=int)
 
     parser = add_fofn_arguments(parser, bas_fofn=True)
-    parser = add_sge_arguments(parser, quiver_nproc=True, blasr_nproc=True)
+    parser = add_sge_arguments(parser, quiver_nproc=True, blasr_nproc=True,
+                               jobs_per_qsub=True)
     parser = add_tmp_dir_argument(parser)
 
     return parser
@@ -194,7 +195,8 @@ class IceQuiverI(object):
             "--bas_fofn={bas_fofn} ".format(bas_fofn=bas_fofn)
         if fasta_fofn is not None:
             cmd += "--fasta_fofn={fasta_fofn} ".format(fasta_fofn=fasta_fofn)
-        cmd += sge_opts.cmd_str(show_blasr_nproc=True, show_quiver_nproc=True)
+        cmd += sge_opts.cmd_str(show_blasr_nproc=True, show_quiver_nproc=True,
+                                show_jobs_per_qsub=True)
         if tmp_dir is not None:
             cmd += "--tmp_dir={tmp_dir} ".format(tmp_dir=tmp_dir)
         return cmd
@@ -119,7 +119,7 @@ import os
 import re
 import logging
 import os.path as op
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 from cPickle import load
 from time import sleep
 
@@ -224,6 +224,7 @@ class IceQuiverPostprocess(IceFiles):
         """Check whether quiver jobs are completed.
         submitted_quiver_jobs.txt should have format like:
         <job_id> \t ./quivered/<range>.sh
+        , where scripts submitted in one batch share a job_id.
 
         (1) if all jobs are done and files are there return True
         (2) if all jobs are done but some files incomplete ask if to resubmit
@@ -234,7 +235,7 @@ class IceQuiverPostprocess(IceFiles):
         done_flag = True
         bad_sh = []
         self.fq_filenames = []
-        submitted = {}
+        submitted = OrderedDict() # sh_name -> job_id
         self.add_log("Submitted quiver jobs are at {f}:".
                      format(f=self.submitted_quiver_jobs_log))
 
@@ -246,7 +247,8 @@ class IceQuiverPostprocess(IceFiles):
                     submitted[b] = b
                 else:
                     sge_used = True
-                    submitted[a] = b
+                    submitted[b] = a
+        submitted_jids = set(submitted.itervalues())
 
         running_jids = []
         if sge_used is True and self.use_sge is True:
@@ -255,11 +257,11 @@ class IceQuiverPostprocess(IceFiles):
             for x in stuff[2:]:
                 job_id = x.split()[0]
                 running_jids.append(job_id)
-                if job_id in submitted:
+                if job_id in submitted_jids:
                     self.add_log("job {0} is still running.".format(job_id))
                     done_flag = False
 
-        for job_id, sh_name in submitted.iteritems():
+        for sh_name, job_id in submitted.iteritems():
             fq_filename = op.join(self.quivered_dir,
                                   op.basename(sh_name).replace('.sh', '.quivered.fastq'))
 
@@ -270,7 +272,7 @@ class IceQuiverPostprocess(IceFiles):
                 else:
                     self.add_log("job {0} is completed but {1} is still empty!".
                                  format(job_id, fq_filename))
-                    bad_sh.append(submitted[job_id])
+                    bad_sh.append(sh_name)
             else:
                 self.add_log("job {0} is done".format(job_id))
                 self.fq_filenames.append(fq_filename)
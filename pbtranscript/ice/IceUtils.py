@@ -6,7 +6,8 @@ import shutil
 import filecmp
 import random
 import time
-from cPickle import dump, load
+import json
+from cPickle import dump, load, HIGHEST_PROTOCOL
 from collections import defaultdict
 import numpy as np
 import pysam
@@ -617,8 +618,7 @@ def concat_sam(samfiles, outsam_filename):
             # ----- end MD5 checking and writing --------- #
             assert h.readline().startswith('@RG')
             assert h.readline().startswith('@PG')
-            for line in h:
-                f_bd.write(line)
+            shutil.copyfileobj(h, f_bd)
 
     f_bd.close()
     f_sq.write(rg_line)
@@ -656,11 +656,14 @@ def concat_bam(in_fns, out_fn):
     # construct sam header
     h = concat_bam_header(in_fns)
     o = BamWriter(out_fn, header=h)
+    # Records are all AlignedSegments, write them to the underlying
+    # pysam file directly, skipping BamWriter.write type dispatch.
+    write = o.peer.write
     for index, in_fn in enumerate(in_fns):
         s = pysam.Samfile(in_fn, 'rb')
         for r in s:
             r.tid = index # Overwrite tid !!!
-            o.write(r)
+            write(r)
         s.close()
     o.close()
 
@@ -848,11 +851,35 @@ def combine_nfl_pickles(splitted_pickles, out_pickle):
         logging.debug("Dumping all to {f}".format(f=out_pickle))
         # Dump to one file
         partial_uc = dict(partial_uc)
-        with open(out_pickle, 'w') as f:
-            dump({'nohit': nohit, 'partial_uc': partial_uc}, f)
+        with open(out_pickle, 'wb') as f:
+            dump({'nohit': nohit, 'partial_uc': partial_uc}, f,
+                 HIGHEST_PROTOCOL)
         logging.debug("{f} created.".format(f=out_pickle))
 
 
+def sorted_cids_fn_of_pickle(pickle_fn):
+    """Return the file which saves sorted cluster ids of pickle_fn."""
+    return pickle_fn + ".cids.json"
+
+
+def write_sorted_cids(uc, pickle_fn):
+    """Save sorted cluster ids of uc next to pickle_fn, so that callers
+    which only need cluster ids do not have to load the whole pickle."""
+    with open(sorted_cids_fn_of_pickle(pickle_fn), 'w') as f:
+        f.write(json.dumps(sorted(uc)))
+
+
+def read_sorted_cids(pickle_fn):
+    """Return sorted cluster ids saved by write_sorted_cids, or None
+    if they are not saved or older than pickle_fn."""
+    fn = sorted_cids_fn_of_pickle(pickle_fn)
+    if pickle_fn.endswith(".json") or not op.exists(fn) or \
+       op.getmtime(fn) < op.getmtime(pickle_fn):
+        return None
+    with open(fn) as f:
+        return json.loads(f.read())
+
+
 def cid_with_annotation(cid):
     """Given a cluster id, return cluster id with human readable annotation.
     e.g., c0 --> c0 isoform=c0
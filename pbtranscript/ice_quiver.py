@@ -81,6 +81,7 @@ Overview:
                           --max_sge_jobs=max_sge_jobs \
                           --unique_id=unique_id \
                           --quiver_nproc=quiver_nproc \
+                          --jobs_per_qsub=jobs_per_qsub \
                           --blasr_nproc=blasr_nproc
             , for i = 0, ..., N-1
         and then collecting all polisehd consensus isoforms:
@@ -173,7 +174,8 @@ class IceQuiverRunner(PBMultiToolRunner):
                                       use_sge=args.use_sge,
                                       max_sge_jobs=args.max_sge_jobs,
                                       blasr_nproc=args.blasr_nproc,
-                                      quiver_nproc=args.quiver_nproc)
+                                      quiver_nproc=args.quiver_nproc,
+                                      jobs_per_qsub=args.jobs_per_qsub)
                 ipq_opts = IceQuiverHQLQOptions(
                     hq_isoforms_fa=args.hq_isoforms_fa,
                     hq_isoforms_fq=args.hq_isoforms_fq,
@@ -193,7 +195,8 @@ class IceQuiverRunner(PBMultiToolRunner):
                                       use_sge=args.use_sge,
                                       max_sge_jobs=args.max_sge_jobs,
                                       blasr_nproc=args.blasr_nproc,
-                                      quiver_nproc=args.quiver_nproc)
+                                      quiver_nproc=args.quiver_nproc,
+                                      jobs_per_qsub=args.jobs_per_qsub)
                 obj = IceQuiverI(root_dir=args.root_dir, i=args.i, N=args.N,
                                  bas_fofn=args.bas_fofn,
                                  fasta_fofn=None,
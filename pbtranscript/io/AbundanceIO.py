@@ -3,6 +3,10 @@
 """Streaming IO support for Abundance files."""
 #FIXME: refactor Abundance classes to allow flexible combo and subsets of columns
 
+import csv
+from itertools import groupby
+from operator import methodcaller
+import numpy as np
 from pbcore.io import ReaderBase, WriterBase
 
 __all__ = ["AbundanceRecord",
@@ -13,6 +17,15 @@ TOTAL_FL = "# Total Number of FL reads:"
 TOTAL_NFL = "# Total Number of FL + unique nFL reads:"
 TOTAL_AMB = "# Total Number of all reads:"
 
+# Position in (total_fl, total_nfl, total_nfl_amb) and type of each total.
+_TOTALS = {TOTAL_FL: (0, int), TOTAL_NFL: (1, int), TOTAL_AMB: (2, float)}
+
+# Types of AbundanceRecord.ATTRIBUTES[1:] in AbundanceReader.to_arrays.
+_ARRAY_DTYPES = (np.int64, np.int64, np.float64, np.float64, np.float64, np.float64)
+
+# Format of an AbundanceRecord line, see AbundanceRecord.ATTRIBUTES.
+_RECORD_FMT = "%s\t%d\t%d\t%.2f\t%.4e\t%.4e\t%.4e"
+
 
 class AbundanceRecord(object):
 
@@ -30,6 +43,7 @@ class AbundanceRecord(object):
     ATTRIBUTES = ["pbid", "count_fl", "count_nfl", "count_nfl_amb",
                   "norm_fl", "norm_nfl", "norm_nfl_amb"]
     HEADER = "\t".join(ATTRIBUTES)
+    __slots__ = tuple(ATTRIBUTES)
 
     def __init__(self, pbid, count_fl, count_nfl, count_nfl_amb, norm_fl, norm_nfl, norm_nfl_amb):
         self.pbid = str(pbid)
@@ -44,7 +58,8 @@ class AbundanceRecord(object):
         self.norm_nfl_amb = type_or_na(float, norm_nfl_amb)
 
     def __str__(self):
-        return "{0}\t{1}\t{2}\t{3:.2f}\t{4:.4e}\t{5:.4e}\t{6:.4e}".format(
+        # %-formatting is faster than str.format on python 2.7
+        return _RECORD_FMT % (
             self.pbid, self.count_fl, self.count_nfl, self.count_nfl_amb,
             self.norm_fl, self.norm_nfl, self.norm_nfl_amb)
 
@@ -57,9 +72,18 @@ class AbundanceRecord(object):
         fields = line.strip().split('\t')
         if len(fields) != 7:
             raise ValueError("Could not recognize %s as a valid AbundanceRecord." % line)
-        return AbundanceRecord(pbid=fields[0], count_fl=fields[1], count_nfl=fields[2],
-                               count_nfl_amb=fields[3], norm_fl=fields[4],
-                               norm_nfl=fields[5], norm_nfl_amb=fields[6])
+        return cls._from_fields(fields)
+
+    @classmethod
+    def _from_fields(cls, fields):
+        """Construct and return a AbundanceRecord object given a list of
+        7 already split fields."""
+        if len(fields) != 7:
+            raise ValueError("Could not recognize %s as a valid AbundanceRecord." %
+                             "\t".join(fields))
+        return cls(pbid=fields[0], count_fl=fields[1], count_nfl=fields[2],
+                   count_nfl_amb=fields[3], norm_fl=fields[4],
+                   norm_nfl=fields[5], norm_nfl_amb=fields[6])
 
 
 class AbundanceReader(ReaderBase):
@@ -79,11 +103,13 @@ class AbundanceReader(ReaderBase):
         """Returns comments as well as the first line (usually header)."""
         comments = []
         firstLine = None
-        for line in self.file:
-            if line.startswith("#"):
-                comments.append(line.rstrip())
+        # groupby reads no further than the first line of the second group,
+        # so the remaining lines are left in self.file for __iter__.
+        for is_comment, lines in groupby(self.file, methodcaller("startswith", "#")):
+            if is_comment:
+                comments = [line.rstrip() for line in lines]
             else:
-                firstLine = line
+                firstLine = next(lines)
                 break
         return comments, firstLine
 
@@ -94,7 +120,7 @@ class AbundanceReader(ReaderBase):
            total_nfl = Total Number of FL + unique nFL reads
            total_nfl_amb = Total Number of all reads
         """
-        total_fl, total_nfl, total_nfl_amb = None, None, None
+        totals = [None, None, None]
         if isinstance(comments, str):
             comments = comments.split("\n")
         elif not isinstance(comments, list):
@@ -102,30 +128,78 @@ class AbundanceReader(ReaderBase):
 
         try:
             for h in comments:
-                if TOTAL_FL in h:
-                    total_fl = int(h.strip().split(":")[-1])
-                elif TOTAL_NFL in h:
-                    total_nfl = int(h.strip().split(":")[-1])
-                elif TOTAL_AMB in h:
-                    total_nfl_amb = float(h.strip().split(":")[-1])
+                h = h.strip()
+                if not h.startswith("# Total "):
+                    continue
+                total = _TOTALS.get(h[:h.find(":") + 1])
+                if total is not None:
+                    totals[total[0]] = total[1](h.rsplit(":", 1)[1])
         except (ValueError, IndexError):
             pass
-        return total_fl, total_nfl, total_nfl_amb
+        return tuple(totals)
 
     def __init__(self, f):
         super(AbundanceReader, self).__init__(f)
         self.comments, self.firstLine = self._read_comments_header()
         self.total_fl, self.total_nfl, self.total_nfl_amb = self.parse_comments(self.comments)
 
+    def _iter_fields(self):
+        """Yield stripped fields of each remaining line in self.file,
+        split only once, skipping blank lines and comments."""
+        for fields in csv.reader(self.file, delimiter='\t',
+                                 quoting=csv.QUOTE_NONE):
+            if len(fields) == 0:
+                continue
+            first = fields[0].strip()
+            if len(first) == 0 and len(fields) == 1:
+                continue
+            if first.startswith("#"):
+                continue
+            fields[0] = first
+            fields[-1] = fields[-1].strip()
+            yield fields
+
     def __iter__(self):
         if self.firstLine:
             if not self.firstLine.strip().startswith('pbid\t'):
                 yield AbundanceRecord.fromString(self.firstLine)
             self.firstLine = None
-        for line in self.file:
-            line = line.strip()
-            if len(line) > 0 and line[0] != "#" and line != AbundanceRecord.HEADER:
-                yield AbundanceRecord.fromString(line)
+        for fields in self._iter_fields():
+            try:
+                record = AbundanceRecord._from_fields(fields)
+            except ValueError:
+                # A header can only follow comments or blank lines and
+                # never parses, so it is checked for only on failure.
+                if fields[0] == "pbid":
+                    continue
+                raise
+            yield record
+
+    def to_arrays(self):
+        """Read all remaining records into a numpy record array with fields
+        AbundanceRecord.ATTRIBUTES, where pbid is a str, count_fl and
+        count_nfl are int64 and the others float64, 'NA' is read as 0.
+        Columns are converted by numpy instead of creating an
+        AbundanceRecord per line, e.g., for statistics over many records.
+        """
+        rows = []
+        if self.firstLine:
+            if not self.firstLine.strip().startswith('pbid\t'):
+                rows.append(self.firstLine.strip().split('\t'))
+            self.firstLine = None
+        rows.extend(fields for fields in self._iter_fields() if fields[0] != "pbid")
+        for fields in rows:
+            if len(fields) != 7:
+                raise ValueError("Could not recognize %s as a valid AbundanceRecord." %
+                                 "\t".join(fields))
+
+        columns = zip(*rows) if len(rows) > 0 else [()] * 7
+        arrays = [np.array(columns[0], dtype=str)]
+        for values, dtype in zip(columns[1:], _ARRAY_DTYPES):
+            a = np.array(values, dtype=str)
+            a[a == 'NA'] = '0'
+            arrays.append(a.astype(dtype))
+        return np.rec.fromarrays(arrays, names=AbundanceRecord.ATTRIBUTES)
 
 
 class AbundanceWriter(WriterBase):
@@ -161,15 +235,17 @@ class AbundanceWriter(WriterBase):
     def _write_comments_header(self, comments):
         """Write comments and the header."""
         c_str = None
-        if comments is not None:
-            if isinstance(comments, str):
-                c_str = comments
-            elif isinstance(comments, list) and len(comments) > 0:
+        if comments is None:
+            if self.total_fl and self.total_nfl and self.total_nfl_amb:
+                c_str = self.make_comments(self.total_fl, self.total_nfl, self.total_nfl_amb)
+        elif isinstance(comments, basestring):
+            c_str = comments
+        else:
+            # Any iterable of str, an empty one writes no comments.
+            try:
                 c_str = "\n".join(comments)
-            else:
+            except TypeError:
                 raise ValueError("comments %s must be either a str or a list of str" % comments)
-        elif self.total_fl and self.total_nfl and self.total_nfl_amb:
-            c_str = self.make_comments(self.total_fl, self.total_nfl, self.total_nfl_amb)
 
         if c_str:
             self.file.write("{0}\n".format(c_str))
@@ -181,4 +257,17 @@ class AbundanceWriter(WriterBase):
         if not isinstance(record, AbundanceRecord):
             raise ValueError("record type %s is not AbundanceRecord." % type(record))
         else:
-            self.file.write("{0}\n".format(str(record)))
+            self.file.write(str(record) + "\n")
+
+    def writeRecords(self, records, batch=8192):
+        """Write AbundanceRecords, batch records per write."""
+        buf = []
+        for record in records:
+            if not isinstance(record, AbundanceRecord):
+                raise ValueError("record type %s is not AbundanceRecord." % type(record))
+            buf.append(str(record))
+            if len(buf) >= batch:
+                self.file.write("\n".join(buf) + "\n")
+                buf = []
+        if len(buf) > 0:
+            self.file.write("\n".join(buf) + "\n")
@@ -348,6 +348,22 @@ class BamCollection(object):
             for rg in bam.readGroupTable:
                 assert rg.ReadType in ["CCS", "SUBREAD"]
 
+        # Lazily built by _rows_of_hole_number
+        self._hn_order = None
+        self._sorted_hns = None
+
+    def _rows_of_hole_number(self, hn):
+        """Return indices of reads in dataset whose holeNumber is hn,
+        in ascending order. Reads are sorted by holeNumber once, so that
+        each lookup is a binary search instead of a scan of the index."""
+        if self._hn_order is None:
+            hns = self._dataset.index.holeNumber
+            self._hn_order = np.argsort(hns, kind='mergesort')
+            self._sorted_hns = hns[self._hn_order]
+        lo = np.searchsorted(self._sorted_hns, hn, side='left')
+        hi = np.searchsorted(self._sorted_hns, hn, side='right')
+        return self._hn_order[lo:hi]
+
     @property
     def movieNames(self):
         """Return movie names as a list of string."""
@@ -396,7 +412,7 @@ class BamCollection(object):
 
         _hn = int(indices[1])
         # for efficiency: first select on hn, then movie name.
-        _reads = self._dataset[self._dataset.index.holeNumber == _hn]
+        _reads = self._dataset[self._rows_of_hole_number(_hn)]
         _reads = [_read for _read in _reads if _read.movieName == _movie]
         if len(_reads) == 0:
             raise KeyError("Could not find %s in %s" % (key, str(self._dataset)))
@@ -162,3 +162,14 @@ class ReadStatWriter(WriterBase):
             raise ValueError("record type %s is not ReadStatRecord." % type(record))
         else:
             self.file.write("{0}\n".format(str(record)))
+
+    def writeFields(self, name, is_fl, stat, pbid):
+        """Write a read status line given fields of a ReadStatRecord,
+        without constructing a ReadStatRecord object.
+        The caller is responsible for passing a valid combination of
+        is_fl (bool), stat (a MapStatus) and pbid (None if unmapped).
+        """
+        self.file.write("%s\t%d\t%s\t%s\t%s\n" %
+                        (name, get_len_from_read_name(name),
+                         'Y' if is_fl is True else 'N', stat,
+                         'NA' if pbid is None else pbid))
@@ -172,11 +172,17 @@ class ChunkTasksPickle(object):
                       key=lambda x: x[0])
 
     @staticmethod
-    def read(in_pickle_file):
-        """Read an object from a pickle file."""
+    def read(in_pickle_file, task_type=None):
+        """Read an object from a pickle file. If task_type is not None,
+        raise TypeError when a task is not an instance of task_type."""
         with open(in_pickle_file, 'rb') as f:
             a = cPickle.load(f)
-            return ChunkTasksPickle(a)
+        if task_type is not None:
+            for task in a:
+                if not isinstance(task, task_type):
+                    raise TypeError("%s is not a %s in %s" %
+                                    (type(task).__name__, task_type.__name__, in_pickle_file))
+        return ChunkTasksPickle(a)
 
     def append(self, chunk_task):
         """Append this chunk_task to self.chunk_tasks."""
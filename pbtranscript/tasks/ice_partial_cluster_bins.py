@@ -7,12 +7,18 @@ PartialChunkTask objects in input pickle.
 
 import logging
 import sys
+import os
+import os.path as op
+import threading
+from collections import defaultdict
+from multiprocessing import Pool
 
 from pbcore.io import ConsensusReadSet
 from pbcommand.cli import pbparser_runner
 from pbcommand.utils import setup_log
 from pbcommand.models import FileTypes
 
+from pbtranscript.ClusterOptions import IceOptions
 from pbtranscript.ice.IcePartial import IcePartialOne
 from pbtranscript.PBTranscriptOptions import (BaseConstants,
                                               get_base_contract_parser)
@@ -20,6 +26,10 @@ from pbtranscript.tasks.TPickles import PartialChunkTask, ChunkTasksPickle
 
 log = logging.getLogger(__name__)
 
+_REQUIRED_QVS = frozenset(['SubstitutionQV', 'InsertionQV', 'DeletionQV'])
+
+_SENTINEL_LINE = "ice_partial of cluster bin %s, nfl chunk %s/%s in %s is DONE: %s\n"
+
 
 class Constants(BaseConstants):
     """Constants used in pbtranscript.tasks.ice_partial_cluster_bins"""
@@ -68,36 +78,156 @@ def task_runner(task, ccs_file, nproc, tmp_dir):
                          tmp_dir=tmp_dir).run()
 
 
-def resolved_tool_contract_runner(rtc):
-    """Given resolved tool contract, run"""
-    p = ChunkTasksPickle.read(rtc.task.input_files[0])
-    assert all([isinstance(task, PartialChunkTask) for task in p])
-    dummy_sentinel_file = rtc.task.input_files[1]
-    ccs_file = rtc.task.input_files[2]
-    nproc = rtc.task.nproc
-    tmp_dir = rtc.task.tmpdir_resources[0].path \
-            if len(rtc.task.tmpdir_resources) > 0 else None
-
-    log.info("Looking for QVs in CCS input...")
+def _ccs_file_with_qvs(ccs_file):
+    """Return ccs_file if every CCS bam in it has all _REQUIRED_QVS,
+    otherwise None, so that default probabilities are used."""
     with ConsensusReadSet(ccs_file) as ds:
         for bam in ds.resourceReaders():
-            qvs = bam.pulseFeaturesAvailable()
-            if qvs != set(['SubstitutionQV', 'InsertionQV', 'DeletionQV']):
+            if not _REQUIRED_QVS.issubset(bam.pulseFeaturesAvailable()):
                 log.warn("Missing QV fields from %s, will use default probabilities",
                          bam.filename)
-                ccs_file = None
-                break
-
-    with open(rtc.task.output_files[0], 'w') as writer:
-        for task in p:
+                return None
+    return ccs_file
+
+
+def _ensure_sensitive_configs(tasks):
+    """Make sure that every distinct consensus_isoforms_file of tasks has its
+    daligner .sensitive.config, listing each directory once instead of
+    checking it task by task, so that no task has to compute it."""
+    refs_of_dir = defaultdict(set)
+    for task in tasks:
+        # IcePartialOne looks for the config next to the real path
+        ref = op.realpath(task.consensus_isoforms_file)
+        refs_of_dir[op.dirname(ref)].add(ref)
+    for d, refs in refs_of_dir.iteritems():
+        try:
+            existing = set(os.listdir(d))
+        except OSError:
+            continue # the task itself will report missing input
+        for ref in refs:
+            if op.basename(ref) + ".sensitive.config" not in existing:
+                log.info("Writing sensitive config of %s", ref)
+                IceOptions().detect_cDNA_size(ref)
+
+
+def _warm_page_cache(file_names, block_size=1<<20):
+    """Read files once and discard the data so that the OS page cache
+    holds them by the time the next task opens them."""
+    for fn in file_names:
+        try:
+            with open(fn, 'rb') as reader:
+                while reader.read(block_size):
+                    pass
+        except (IOError, OSError, TypeError):
+            pass # the task itself will report missing input
+
+
+def _prefetch_task_inputs(task):
+    """Start warming inputs of task in a background thread, return the thread.
+    Paths are made absolute up front, because the running task chdirs
+    (see DalignerRunner.run) while the thread reads."""
+    file_names = [op.abspath(fn) for fn in
+                  (task.nfl_file, task.consensus_isoforms_file) if fn is not None]
+    t = threading.Thread(target=_warm_page_cache, args=(file_names,))
+    t.daemon = True
+    t.start()
+    return t
+
+
+def _files_shared_by_task(task, tmp_dir):
+    """Return paths of directories and files that task writes to and
+    which other tasks may write to as well:
+    (1) the directory of its nfl_pickle, which holds daligner scripts
+        and intermediate files;
+    (2) its nfl_file and consensus_isoforms_file, next to which dazz
+        fasta, pickle and DB files are written if tmp_dir is None;
+    (3) tmp_dir, where dazz files are written by basename otherwise.
+    """
+    files = [op.dirname(op.realpath(task.nfl_pickle)),
+             op.realpath(task.nfl_file),
+             op.realpath(task.consensus_isoforms_file)]
+    if tmp_dir is not None:
+        files.append(op.realpath(tmp_dir))
+    return files
+
+
+def _group_tasks_sharing_files(tasks, tmp_dir=None):
+    """Group PartialChunkTasks so that tasks sharing any of
+    _files_shared_by_task, e.g., cluster bins aligning the same nfl chunk,
+    fall into the same group and run sequentially; tasks of different
+    groups are independent. Tasks keep their input order within a group."""
+    groups = [] # a list of (shared files, task indices) tuples
+    for i, task in enumerate(tasks):
+        files, indices = set(_files_shared_by_task(task, tmp_dir)), [i]
+        others = []
+        for g_files, g_indices in groups:
+            if g_files & files:
+                files |= g_files
+                indices.extend(g_indices)
+            else:
+                others.append((g_files, g_indices))
+        groups = others + [(files, indices)]
+    return [[tasks[i] for i in sorted(indices)]
+            for dummy_files, indices in sorted(groups, key=lambda g: min(g[1]))]
+
+
+def _run_task_group(args):
+    """Sequentially run a group of PartialChunkTasks, return the group."""
+    tasks, ccs_file, nproc, tmp_dir = args
+    prefetcher = None
+    try:
+        for i, task in enumerate(tasks):
+            if prefetcher is not None:
+                prefetcher.join()
+            # Read inputs of the next task while the current one computes.
+            prefetcher = _prefetch_task_inputs(tasks[i+1]) \
+                    if i + 1 < len(tasks) else None
             log.info("Running ice_partial on cluster bin %s, nfl chunk %s/%s",
                      str(task.cluster_bin_index),
                      str(task.nfl_index), str(task.n_nfl_chunks))
             task_runner(task=task, ccs_file=ccs_file, nproc=nproc, tmp_dir=tmp_dir)
-            writer.write("ice_partial of cluster bin %s, nfl chunk %s/%s in %s is DONE: %s\n" %
-                         (task.cluster_bin_index, task.nfl_index, task.n_nfl_chunks,
-                          task.cluster_out_dir, task.nfl_pickle))
+    finally:
+        if prefetcher is not None:
+            prefetcher.join()
+    return tasks
+
 
+def resolved_tool_contract_runner(rtc):
+    """Given resolved tool contract, run"""
+    p = ChunkTasksPickle.read(rtc.task.input_files[0], PartialChunkTask)
+    dummy_sentinel_file = rtc.task.input_files[1]
+    ccs_file = rtc.task.input_files[2]
+    nproc = rtc.task.nproc
+    tmp_dir = rtc.task.tmpdir_resources[0].path \
+            if len(rtc.task.tmpdir_resources) > 0 else None
+
+    log.info("Looking for QVs in CCS input...")
+    ccs_file = _ccs_file_with_qvs(ccs_file)
+
+    _ensure_sensitive_configs(p)
+
+    # Run independent task groups in separate processes, splitting nproc
+    # among them. Not threads: DalignerRunner.run chdirs into its output
+    # dir, and the cwd is shared by all threads of a process.
+    groups = _group_tasks_sharing_files(list(p), tmp_dir)
+    n_workers = max(1, min(nproc, len(groups)))
+    task_nproc = max(1, nproc // n_workers)
+    log.info("Running %s ice_partial task groups with %s workers, nproc=%s each",
+             len(groups), n_workers, task_nproc)
+
+    pool = Pool(n_workers)
+    try:
+        with open(rtc.task.output_files[0], 'w', 1 << 16) as writer:
+            for tasks in pool.imap_unordered(
+                    _run_task_group,
+                    [(tasks, ccs_file, task_nproc, tmp_dir) for tasks in groups]):
+                writer.writelines(_SENTINEL_LINE %
+                                  (task.cluster_bin_index, task.nfl_index, task.n_nfl_chunks,
+                                   task.cluster_out_dir, task.nfl_pickle)
+                                  for task in tasks)
+    finally:
+        pool.close()
+        pool.join()
 
 def main():
     """main"""
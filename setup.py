@@ -33,7 +33,9 @@ ext_modules = [Extension("pbtranscript.findECE",
                           include_dirs=['pbtranscript/collapsing/C/src']),
                Extension("pbtranscript.collapsing.c_branch",
                          ["pbtranscript/collapsing/C/c_branch.pyx"], language="c++",
-                         include_dirs=[numpy.get_include()])
+                         include_dirs=[numpy.get_include()]),
+               Extension("pbtranscript.counting.c_count",
+                         ["pbtranscript/counting/C/c_count.pyx"])
               ]
 
 
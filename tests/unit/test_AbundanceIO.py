@@ -24,6 +24,7 @@ class TEST_AbundanceIO(unittest.TestCase):
 
         new_record = AbundanceRecord.fromString(expected_str)
         self.assertEqual(str(new_record), expected_str)
+        self.assertFalse(hasattr(new_record, "__dict__"))
 
     def test_AbundanceReader_Writer(self):
         """test AbundanceReader and AbundanceWriter"""
@@ -54,3 +55,41 @@ class TEST_AbundanceIO(unittest.TestCase):
             writer.writeRecord(r)
         writer.close()
         self.assertTrue(filecmp.cmp(out_fn, ABUNDANCE_FN))
+
+        out_fn = op.join(OUT_DIR, "test_Abundance3.txt")
+        writer = AbundanceWriter(out_fn, reader.comments)
+        writer.writeRecords(records, batch=2)
+        writer.close()
+        self.assertTrue(filecmp.cmp(out_fn, ABUNDANCE_FN))
+
+        out_fn = op.join(OUT_DIR, "test_Abundance4.txt")
+        writer = AbundanceWriter(out_fn, tuple(reader.comments))
+        writer.writeRecords(records)
+        writer.close()
+        self.assertTrue(filecmp.cmp(out_fn, ABUNDANCE_FN))
+
+        # a single str or unicode comment is written as is
+        for comments in ("\n".join(reader.comments), u"\n".join(reader.comments)):
+            out_fn = op.join(OUT_DIR, "test_Abundance6.txt")
+            writer = AbundanceWriter(out_fn, comments)
+            writer.writeRecords(records)
+            writer.close()
+            self.assertTrue(filecmp.cmp(out_fn, ABUNDANCE_FN))
+
+        out_fn = op.join(OUT_DIR, "test_Abundance5.txt")
+        writer = AbundanceWriter(out_fn, [])
+        writer.close()
+        self.assertEqual(open(out_fn).read(), AbundanceRecord.HEADER + "\n")
+
+        self.assertRaises(ValueError, AbundanceWriter, out_fn, 5)
+
+    def test_AbundanceReader_to_arrays(self):
+        """test AbundanceReader.to_arrays"""
+        records = [r for r in AbundanceReader(ABUNDANCE_FN)]
+        reader = AbundanceReader(ABUNDANCE_FN)
+        arrays = reader.to_arrays()
+        reader.close()
+        self.assertEqual(len(arrays), len(records))
+        self.assertEqual(list(arrays.dtype.names), AbundanceRecord.ATTRIBUTES)
+        for attr in AbundanceRecord.ATTRIBUTES:
+            self.assertEqual(list(arrays[attr]), [getattr(r, attr) for r in records])
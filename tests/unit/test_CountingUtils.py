@@ -1,11 +1,15 @@
 """Test classes defined within pbtranscript.counting.CountUtils."""
 import unittest
+import os
 import os.path as op
+from cPickle import dump
 from pbcore.util.Process import backticks
 from pbtranscript.Utils import rmpath, mkdir
-from pbtranscript.io import ReadStatReader, AbundanceReader
+from pbtranscript.io import ReadStatReader, ReadStatWriter, AbundanceReader, MapStatus
 from pbtranscript.counting.CountingUtils import read_group_file, \
-         output_read_count_FL, output_read_count_nFL, make_abundance_file
+         output_read_count_FL, output_read_count_nFL, make_abundance_file, \
+         convert_pickle_to_msgpack, _iter_pickle_records, msgpack, \
+         _tally_read_stats, _tally_read_stats_with_pandas, pd
 from test_setpath import DATA_DIR, OUT_DIR, SIV_DATA_DIR
 
 _SIV_DIR_ = op.join(SIV_DATA_DIR, "test_counting")
@@ -13,6 +17,28 @@ _DAT_DIR_ = op.join(DATA_DIR, "test_counting")
 
 GROUP_FN = op.join(_SIV_DIR_, "group.txt")
 
+
+def _write_uc_pickle(pickle_filename, uc, partial_uc, nohit):
+    """Write a small uc pickle."""
+    with open(pickle_filename, 'wb') as writer:
+        dump({'uc': uc, 'partial_uc': partial_uc, 'nohit': nohit}, writer)
+
+
+def _sorted_records(pickle_filename):
+    """Return sorted (field, cid, sorted read_ids) of a uc pickle."""
+    return sorted((field, cid, sorted(read_ids)) for field, cid, read_ids
+                  in _iter_pickle_records(pickle_filename))
+
+
+def _tally_by_pbid(tally):
+    """Return ({pbid: (fl, nfl, nfl_amb)}, (total_fl, total_nfl, total_nfl_amb))
+    of a _tally_read_stats output, independent of pbid indices."""
+    pbid_to_idx, fl, nfl, nfl_amb, total_fl, total_nfl, total_nfl_amb = tally
+    counts = dict((pbid, (int(fl[i]), int(nfl[i]), round(float(nfl_amb[i]), 6)))
+                  for pbid, i in pbid_to_idx.iteritems())
+    return counts, (total_fl, total_nfl, total_nfl_amb)
+
+
 class TEST_CountUtils(unittest.TestCase):
     """Test functions of pbtranscript.counting.CountUtils."""
     def setUp(self):
@@ -40,6 +66,89 @@ class TEST_CountUtils(unittest.TestCase):
         self.assertEqual(cid_info['i1_HQ_sampleb92221']['c1030'], 'PB.5.6')
         self.assertEqual(cid_info['i2_HQ_sampleb92221']['c326'], 'PB.10.14')
 
+    @unittest.skipUnless(msgpack is not None, "msgpack not installed")
+    def test_convert_pickle_to_msgpack(self):
+        """Test convert_pickle_to_msgpack and reading its msgpack sidecar."""
+        pickle_fn = op.join(OUT_DIR, "test_convert_pickle_to_msgpack.pickle")
+        msgpack_fn = pickle_fn + '.msgpack'
+        rmpath(msgpack_fn)
+        _write_uc_pickle(pickle_fn, uc={0: ['m0/1/ccs', 'm0/2/ccs'], 1: ['m1/3/ccs']},
+                         partial_uc={0: ['m0/4/0_100']}, nohit=set(['m1/5/0_200']))
+        expected = [('nohit', None, ['m1/5/0_200']),
+                    ('partial_uc', 0, ['m0/4/0_100']),
+                    ('uc', 0, ['m0/1/ccs', 'm0/2/ccs']),
+                    ('uc', 1, ['m1/3/ccs'])]
+        self.assertEqual(_sorted_records(pickle_fn), expected)
+
+        self.assertEqual(convert_pickle_to_msgpack(pickle_fn), msgpack_fn)
+        self.assertTrue(op.exists(msgpack_fn))
+        self.assertEqual(_sorted_records(pickle_fn), expected)
+
+    @unittest.skipUnless(msgpack is not None, "msgpack not installed")
+    def test_stale_msgpack_is_ignored(self):
+        """Test that a msgpack sidecar older than its pickle is not read."""
+        pickle_fn = op.join(OUT_DIR, "test_stale_msgpack_is_ignored.pickle")
+        _write_uc_pickle(pickle_fn, uc={0: ['m0/1/ccs']}, partial_uc={}, nohit=set())
+        msgpack_fn = convert_pickle_to_msgpack(pickle_fn)
+
+        # Re-cluster: the pickle changes after the sidecar was written.
+        _write_uc_pickle(pickle_fn, uc={7: ['m0/8/ccs']}, partial_uc={}, nohit=set())
+        t = op.getmtime(pickle_fn)
+        os.utime(msgpack_fn, (t - 10, t - 10))
+        self.assertEqual(_sorted_records(pickle_fn),
+                         [('nohit', None, []), ('uc', 7, ['m0/8/ccs'])])
+
+    @unittest.skipUnless(pd is not None, "pandas not installed")
+    def test_tally_read_stats_with_pandas(self):
+        """Test that _tally_read_stats_with_pandas tallies the same as _tally_read_stats."""
+        read_stat_fn = op.join(OUT_DIR, "test_tally_read_stats_with_pandas.read_stat.txt")
+        writer = ReadStatWriter(read_stat_fn)
+        for name, is_fl, stat, pbid in [
+                ("m0/1/0_100_CCS", True, MapStatus.UNIQUELY_MAPPED, "PB.1.1"),
+                ("m0/2/0_200_CCS", True, MapStatus.UNIQUELY_MAPPED, "PB.1.1"),
+                ("m1/3/0_300_CCS", True, MapStatus.UNIQUELY_MAPPED, "PB.2.1"),
+                ("m1/4/0_400_CCS", True, MapStatus.UNMAPPED, None),
+                ("m0/5/0_500", False, MapStatus.UNIQUELY_MAPPED, "PB.2.1"),
+                ("m1/6/0_600", False, MapStatus.UNIQUELY_MAPPED, "PB.1.2"),
+                ("m0/7/0_700", False, MapStatus.AMBIGUOUSLY_MAPPED, "PB.1.1"),
+                ("m0/7/0_700", False, MapStatus.AMBIGUOUSLY_MAPPED, "PB.2.1"),
+                ("m1/8/0_800", False, MapStatus.AMBIGUOUSLY_MAPPED, "PB.1.1"),
+                ("m1/8/0_800", False, MapStatus.AMBIGUOUSLY_MAPPED, "PB.1.2"),
+                ("m1/8/0_800", False, MapStatus.AMBIGUOUSLY_MAPPED, "PB.3.1"),
+                ("m0/9/0_900", False, MapStatus.UNMAPPED, None)]:
+            writer.writeFields(name=name, is_fl=is_fl, stat=stat, pbid=pbid)
+        writer.close()
+
+        expected = {'PB.1.1': (2, 0, round(1/2. + 1/3., 6)),
+                    'PB.1.2': (0, 1, round(1/3., 6)),
+                    'PB.2.1': (1, 1, round(1/2., 6)),
+                    'PB.3.1': (0, 0, round(1/3., 6))}
+        for tally in (_tally_read_stats, _tally_read_stats_with_pandas):
+            self.assertEqual(_tally_by_pbid(tally(read_stat_fn)), (expected, (4, 3, 2)))
+
+        restricted_movies = frozenset(["m0"])
+        expected = {'PB.1.1': (2, 0, round(1/2., 6)),
+                    'PB.2.1': (0, 1, round(1/2., 6))}
+        for tally in (_tally_read_stats, _tally_read_stats_with_pandas):
+            self.assertEqual(_tally_by_pbid(tally(read_stat_fn, restricted_movies)),
+                             (expected, (2, 2, 1)))
+
+    def test_make_abundance_file_zero_total(self):
+        """Test that make_abundance_file raises ZeroDivisionError when
+        read counts can not be normalized."""
+        read_stat_fn = op.join(OUT_DIR, "test_make_abundance_file_zero_total.read_stat.txt")
+        writer = ReadStatWriter(read_stat_fn)
+        writer.writeFields(name="m0/5/0_500", is_fl=False,
+                           stat=MapStatus.UNIQUELY_MAPPED, pbid="PB.1.1")
+        writer.close()
+        out_fn = op.join(OUT_DIR, "test_make_abundance_file_zero_total.abundance.txt")
+        # no FL reads at all
+        self.assertRaises(ZeroDivisionError, make_abundance_file,
+                          read_stat_fn, out_fn)
+        # no reads of restricted movies, hence no records
+        make_abundance_file(read_stat_fn, out_fn, restricted_movies=["m1"])
+        self.assertEqual(len([r for r in AbundanceReader(out_fn)]), 0)
+
     def test_output_read_count_FL(self):
         """Test output_read_count_FL."""
         d = op.join(SIV_DATA_DIR, "test_make_abundance")
@@ -260,3 +260,13 @@ class Test_ICEUtils(unittest.TestCase):
         in_xml = op.join(self.sivDataDir, "test_tool_contract_chunks/isoseq_flnc.contigset.xml")
         self.assertEqual(226, num_reads_in_fasta(in_fa))
         self.assertEqual(161, num_reads_in_fasta(in_xml))
+
+    def test_write_read_sorted_cids(self):
+        """Test write_sorted_cids and read_sorted_cids."""
+        pickle_fn = op.join(OUT_DIR, "test_write_read_sorted_cids.pickle")
+        with open(pickle_fn, 'w') as f:
+            f.write("")
+        uc = {10: ['a'], 2: ['b'], 7: []}
+        write_sorted_cids(uc=uc, pickle_fn=pickle_fn)
+        self.assertEqual(read_sorted_cids(pickle_fn), [2, 7, 10])
+        self.assertIsNone(read_sorted_cids(pickle_fn + ".nonexist"))
@@ -73,3 +73,17 @@ class TEST_ReadStatIO(unittest.TestCase):
         writer.close()
         records = [r for r in ReadStatReader(out_fn)]
         self.assertEqual(len(records), 3 * 2)
+
+    def test_ReadStatWriter_writeFields(self):
+        """Test ReadStatWriter.writeFields."""
+        out_fn = op.join(_OUT_DIR_, 'readstat_fields.txt')
+        expected = [ReadStatRecord(name="movie/100/123_0_CCS", is_fl=True,
+                                   stat="unique", pbid="PB.1.1"),
+                    ReadStatRecord(name="movie1/200/399_0_CCS", is_fl=False,
+                                   stat="unmapped", pbid=None)]
+        writer = ReadStatWriter(out_fn, 'w')
+        for r in expected:
+            writer.writeFields(name=r.name, is_fl=r.is_fl, stat=r.stat, pbid=r.pbid)
+        writer.close()
+        records = [r for r in ReadStatReader(out_fn)]
+        self.assertEqual(records, expected)
@@ -5,6 +5,7 @@ import os.path as op
 import filecmp
 from pbcore.util.Process import backticks
 from pbtranscript.RunnerUtils import *
+import pbtranscript.RunnerUtils as RunnerUtils
 from pbtranscript.ClusterOptions import SgeOptions
 from test_setpath import DATA_DIR, OUT_DIR, STD_DIR, SIV_DATA_DIR
 
@@ -50,6 +51,41 @@ class TestRunnerUtils(unittest.TestCase):
         """Test get_active_sge_jobs"""
         self.assertTrue(isinstance(get_active_sge_jobs(), dict))
 
+    def test_sge_submit_invalidates_qstat_cache(self):
+        """Test that wait_for_sge_jobs does not reuse a qstat snapshot
+        taken before sge_submit."""
+        qstat_outputs = [{}, {'42': 'r'}, {}]
+        def fake_qstat():
+            return qstat_outputs.pop(0)
+        def fake_backticks(cmd):
+            return ('Your job 42 ("a.sh") has been submitted', 0, None)
+        class FakeTime(object):
+            """A fake clock, which only advances when sleeping."""
+            now = 1000.0
+            @classmethod
+            def time(cls):
+                return cls.now
+            @classmethod
+            def sleep(cls, seconds):
+                cls.now += seconds
+
+        orig = (RunnerUtils._parse_qstat_xml, RunnerUtils.backticks, RunnerUtils.time)
+        RunnerUtils._parse_qstat_xml = fake_qstat
+        RunnerUtils.backticks = fake_backticks
+        RunnerUtils.time = FakeTime
+        RunnerUtils._invalidate_qstat_cache()
+        try:
+            self.assertEqual(get_active_sge_jobs(), {}) # cached, without job 42
+            jid = sge_submit("qsub a.sh")
+            self.assertEqual(jid, "42")
+            # qstat is called again after submission, and reports job 42
+            # as active before it is done.
+            self.assertEqual(wait_for_sge_jobs(jids=[jid]), [])
+            self.assertEqual(qstat_outputs, [])
+        finally:
+            RunnerUtils._parse_qstat_xml, RunnerUtils.backticks, RunnerUtils.time = orig
+            RunnerUtils._invalidate_qstat_cache()
+
     @unittest.skipUnless(backticks('qstat')[1] == 0, "sge disabled")
     def test_sge_submit(self):
         """Test sge_submit."""
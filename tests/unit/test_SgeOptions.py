@@ -3,6 +3,7 @@
 import unittest
 import os.path as op
 import filecmp
+from cPickle import dumps, loads
 from pbtranscript.ClusterOptions import SgeOptions
 
 class TestSgeOptions(unittest.TestCase):
@@ -23,3 +24,34 @@ class TestSgeOptions(unittest.TestCase):
         self.assertEqual(sge_opts.qsub_cmd("a.sh", num_threads=1,
                          wait_before_exit=True, depend_on_jobs=['1', '2', '3']),
                          "qsub -cwd -V -S /bin/bash -pe orte 1 -q my_sge_queue -sync y -hold_jid 1,2,3 -e /dev/null -o /dev/null a.sh")
+
+    def test_qsub_cmd_template(self):
+        """Test qsub_cmd_template."""
+        sge_opts = SgeOptions(unique_id=100, sge_queue="my_sge_queue")
+        template = sge_opts.qsub_cmd_template(num_threads=4)
+        self.assertEqual(template,
+                         "qsub -cwd -V -S /bin/bash -pe smp 4 -q my_sge_queue -e {elog} -o {olog} {script}")
+        self.assertEqual(template.format(script="a.sh", elog="a.sh.elog", olog="a.sh.olog"),
+                         sge_opts.qsub_cmd("a.sh", num_threads=4,
+                                           elog="a.sh.elog", olog="a.sh.olog"))
+
+    def test_cmd_str_jobs_per_qsub(self):
+        """Test cmd_str shows --jobs_per_qsub only when asked and using sge."""
+        sge_opts = SgeOptions(unique_id=100, use_sge=True, max_sge_jobs=10,
+                              jobs_per_qsub=8)
+        self.assertEqual(sge_opts.cmd_str(),
+                         "--use_sge --max_sge_jobs=10 --unique_id=100 ")
+        self.assertEqual(sge_opts.cmd_str(show_jobs_per_qsub=True),
+                         "--use_sge --max_sge_jobs=10 --unique_id=100 --jobs_per_qsub=8 ")
+        sge_opts = SgeOptions(unique_id=100, jobs_per_qsub=8)
+        self.assertEqual(sge_opts.cmd_str(show_jobs_per_qsub=True), "")
+
+    def test_unpickle_without_jobs_per_qsub(self):
+        """Test SgeOptions pickled before jobs_per_qsub existed."""
+        sge_opts = SgeOptions(unique_id=100, use_sge=True, max_sge_jobs=10)
+        del sge_opts.__dict__['jobs_per_qsub']
+        sge_opts = loads(dumps(sge_opts))
+        self.assertEqual(sge_opts.jobs_per_qsub, 1)
+        self.assertTrue("jobs_per_qsub=1\n" in str(sge_opts))
+        self.assertEqual(sge_opts.cmd_str(show_jobs_per_qsub=True),
+                         "--use_sge --max_sge_jobs=10 --unique_id=100 --jobs_per_qsub=1 ")
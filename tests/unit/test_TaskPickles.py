@@ -47,6 +47,9 @@ class Test_ChunkTasksPickle(unittest.TestCase):
         self.assertEqual(len(q), self.NUM)
 
         self.assertTrue(all([isinstance(r, ChunkTask) for r in p]))
+        self.assertEqual(len(ChunkTasksPickle.read(fn, ChunkTask)), self.NUM)
+        with self.assertRaises(TypeError):
+            ChunkTasksPickle.read(fn, PartialChunkTask)
 
         p.append(self.append_chunk_task)
         self.assertEqual(len(p), self.NUM + 1)
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+
+"""Test pbtranscript.tasks.ice_partial_cluster_bins."""
+import unittest
+import os.path as op
+from pbtranscript.tasks.TPickles import PartialChunkTask
+from pbtranscript.tasks.ice_partial_cluster_bins import _group_tasks_sharing_files
+from test_setpath import OUT_DIR
+
+_OUT_DIR_ = op.join(OUT_DIR, "test_tasks_ice_partial_cluster_bins")
+
+
+def _partial_chunk_task(cluster_bin_index, nfl_index, n_nfl_chunks=2):
+    """Return a PartialChunkTask of cluster bin and nfl chunk."""
+    return PartialChunkTask(cluster_bin_index=cluster_bin_index,
+                            flnc_file=op.join(_OUT_DIR_, "flnc_%s.fasta" % cluster_bin_index),
+                            cluster_out_dir=op.join(_OUT_DIR_, "bin_%s" % cluster_bin_index),
+                            nfl_file=op.join(_OUT_DIR_, "nfl.%s.fasta" % nfl_index),
+                            nfl_index=nfl_index, n_nfl_chunks=n_nfl_chunks)
+
+
+class TestIcePartialClusterBins(unittest.TestCase):
+    """Test pbtranscript.tasks.ice_partial_cluster_bins."""
+
+    def test_group_tasks_sharing_files(self):
+        """Test that tasks sharing files are never in different groups."""
+        # bins 0 and 1 share nfl chunks 0 and 1, bin 2 has its own nfl chunk 2.
+        tasks = [_partial_chunk_task(0, 0), _partial_chunk_task(0, 1),
+                 _partial_chunk_task(1, 0), _partial_chunk_task(1, 1),
+                 _partial_chunk_task(2, 2, 3)]
+        groups = _group_tasks_sharing_files(tasks)
+        self.assertEqual(groups, [tasks[0:4], tasks[4:5]])
+
+        # same nfl_file, different output dirs
+        tasks = [_partial_chunk_task(0, 0), _partial_chunk_task(1, 0)]
+        self.assertEqual(_group_tasks_sharing_files(tasks), [tasks])
+
+        # nothing shared
+        tasks = [_partial_chunk_task(0, 0), _partial_chunk_task(1, 1)]
+        self.assertEqual(_group_tasks_sharing_files(tasks), [[tasks[0]], [tasks[1]]])
+
+        # a shared tmp_dir
+        self.assertEqual(_group_tasks_sharing_files(tasks, tmp_dir=_OUT_DIR_), [tasks])